@@ -1,18 +1,35 @@
+import os
 from orbit.database import Database
-from orbit.backend import ObjectInOrbit, Star
-from orbit import envs
+from orbit.backend import ObjectInOrbit, Star, get_swept_areas_deviation
+from orbit.catalog import OrbitCatalog
+from orbit.cache import DiskCache, get_cache
+from orbit import envs, kepler, epoch
 try:
-    from orbit.rig import Rig, File
+    from orbit.rig import Rig, File, delete_rig
     STANDALONE = False
 except:
     STANDALONE = True
 
 class Api():
     """This class initializes the database and allows it to be edited
+
+        Args:
+            project_path (str): the project directory
+            pool (bool, optional): Opens one database connection per thread, so the
+                database can be read while a background import writes. Defaults to False.
+            cache (DiskCache, optional): the cache of derived data shared by the projects.
+                Defaults to the user cache, opened on first use. False to disable it.
+            read_only (bool, optional): Opens an existing project read-only and memory mapped,
+                e.g. to browse the examples. Defaults to False.
     """
-    def __init__(self, project_path:str) -> None:
-        self._db = Database(project_path)
+    def __init__(self, project_path:str, pool:bool=False, cache:DiskCache=None,
+                 read_only:bool=False) -> None:
+        self._db = Database(project_path, pool, read_only=read_only)
+        self._cache = cache
         self._project_path = project_path
+        self._synced = self._db.get_last_change()
+        # keys computed during a build, written at its end in one transaction
+        self._new_keys = {}
 
         if not STANDALONE:
             self._file = File()
@@ -31,39 +48,253 @@ class Api():
         unparented = []
         parented = []
         stars = []
-        for elem in self.read():
-            if not elem[1] == envs.T_STAR: # type
-                if elem[2] == envs.ORIGIN: # parent
+        for elem in self.iter_elements():
+            if not elem.type == envs.T_STAR:
+                if elem.parent == envs.ORIGIN:
                     unparented.append(elem)
                 else:
                     parented.append(elem)
             else:
                 stars.append(elem)
 
+        # satellites of satellites after their parent
+        parents = {elem.name : elem.parent for elem in parented}
+        def depth(name:str) ->int:
+            level = 0
+            while name in parents and level <= len(parents):
+                name = parents[name]
+                level += 1
+            return level
+        parented.sort(key=lambda elem: depth(elem.name))
+
         self._elements = unparented + parented + stars
         self._children = unparented + parented
 
     def build_all(self, rebuild:bool=True) ->None:
-        for elem in self._elements:
-            self.add_element(elem, rebuild)
+        # parent masses from the rows just read
+        masses = {elem.name : elem.mass for elem in self._elements}
+        objects = [self.build_object(elem, masses.get(elem.parent, envs.SOLAR_MASS)) for elem in self._elements]
+        # a read-only project is only visualised
+        if not self._db.is_read_only():
+            self._db.insert_objects(obj.read() for obj in objects)
+
+        if not STANDALONE:
+            for obj in objects:
+                self.build_rig(obj, rebuild)
+            self._save_keys()
+        self.set_synced(self._db.get_last_change())
+
+    def get_synced(self) ->int:
+        """Gets the sequence number of the last change applied. In Maya, it is saved
+        in the scene, so a reopened scene knows what changed since.
+        """
+        if not STANDALONE:
+            return self._file.get_synced()
+        return self._synced
+
+    def set_synced(self, seq:int) ->None:
+        self._synced = seq
+        if not STANDALONE:
+            self._file.set_synced(seq)
+
+    def changes_since(self, seq:int=0) ->list:
+        """Gets the changes of the database after a sequence number, so a scene,
+        a UI or an exporter can apply only what changed since it last synced.
+
+        Args:
+            seq (int, optional): the last sequence number already applied. Defaults to 0.
+
+        Returns:
+            list[tuple]: (seq, name, operation), in order. Operations are envs.C_INSERT,
+                envs.C_UPDATE or envs.C_DELETE
+        """
+        return self._db.changes_since(seq)
+
+    def get_last_change(self) ->int:
+        """Gets the sequence number of the latest change of the database.
+        """
+        return self._db.get_last_change()
+
+    def sync(self, since:int=None) ->int:
+        """Rebuilds only the elements changed since a sequence number, with their
+        children and the stars, deletes the removed ones.
+        If standalone, only the sequence number is updated.
+
+        Args:
+            since (int, optional): the last sequence number applied. Defaults to the one
+                of the last sync or build_all, saved in the scene in Maya.
+
+        Returns:
+            int: the sequence number to give to the next sync
+        """
+        if since is None:
+            since = self.get_synced()
+        # only the latest operation of each element matters
+        latest = {}
+        seq = since
+        for seq, name, operation in self._db.changes_since(since):
+            latest[name] = operation
+
+        if latest:
+            self.init_elements()
+        if not STANDALONE and latest:
+            for name, operation in latest.items():
+                if operation == envs.C_DELETE:
+                    delete_rig(name)
+
+            # a rebuilt rig deletes the nodes its children and the stars are constrained to,
+            # and the mass of a parent changes the orbits of its children
+            rebuild = {name for name, operation in latest.items() if operation != envs.C_DELETE}
+            children = {}
+            for elem in self._children:
+                children.setdefault(elem.parent, []).append(elem.name)
+            pending = list(rebuild)
+            while pending:
+                for child in children.get(pending.pop(), []):
+                    if child not in rebuild:
+                        rebuild.add(child)
+                        pending.append(child)
+
+            # rows just read, the find_object cache may miss a write of another connection
+            masses = {elem.name : elem.mass for elem in self._elements}
+            for elem in self._elements:
+                if elem.name in rebuild or elem.type == envs.T_STAR:
+                    self.build_rig(self.build_object(elem, masses.get(elem.parent, envs.SOLAR_MASS)))
+            self._save_keys()
+
+        self.set_synced(seq)
+        return seq
+
+    def add_elements(self, elems:list, rebuild:bool=True, batch_size:int=1000) ->None:
+        """Adds many elements to the database in a single transaction,
+        then reloads the elements once. If ran in Maya, will create the 3D visualisations.
+        A read-only project cannot be added to, raises a RuntimeError.
+
+        Args:
+            elems (list[list]): the physical and orbital characteristics of each element
+            rebuild (bool, optional): Rebuilds the existing 3D orbits. Defaults to True.
+            batch_size (int, optional): nb of rows sent to the database at once. Defaults to 1000.
+        """
+        if self._db.is_read_only():
+            raise RuntimeError(f"Cannot add elements, the project '{self._project_path}' is read-only.")
+        # parents may be in the same batch, not in the database yet
+        masses = {elem[0] : elem[3] for elem in elems}
+        objects = [self.build_object(elem, masses.get(elem[2])) for elem in elems]
+        self._db.insert_objects((obj.read() for obj in objects), batch_size)
+        self.init_elements()
+
+        if not STANDALONE:
+            # parents first, stars last and built again with their new children
+            objects = {obj.get_name() : obj for obj in objects}
+            for elem in self._elements:
+                if elem.name not in objects:
+                    continue
+                obj = self.build_object(elem) if elem.type == envs.T_STAR else objects[elem.name]
+                self.build_rig(obj, rebuild)
+            self._save_keys()
 
     def add_element(self, elem:list, rebuild:bool=True) ->None:
         """Adds an element to the database. If ran in Maya, will create a 3D visualisation.
+        A read-only project is not written, the element is only visualised.
 
         Args:
             elem (list): the physical and orbital characteristics
             rebuild (bool, optional): Rebuilds the existing 3D orbit. Defaults to True.
         """
+        obj = self.build_object(elem)
+        if not self._db.is_read_only():
+            self._db.insert_object(obj.read())
+
+        if not STANDALONE:
+            self.build_rig(obj, rebuild)
+            self._save_keys()
+
+    def build_rig(self, obj, rebuild:bool=True) ->None:
+        """Creates the 3D visualisation of an object (Maya only).
+
+        Args:
+            obj (ObjectInOrbit | Star): the object
+            rebuild (bool, optional): Rebuilds the existing 3D orbit. Defaults to True.
+        """
+        rig = Rig(obj, color=envs.COLORS[obj.get_type()])
+        if rebuild == False:
+            if rig._exists():
+                return
+        if obj.get_type() != envs.T_STAR:
+            rig = Rig(obj, color=envs.COLORS[obj.get_type()], keys=self.get_keys(obj))
+        rig.build()
+
+    def get_keys(self, obj:ObjectInOrbit) ->dict:
+        """Gets the orbit keys of an object from the cache of the database, or else
+        from the user cache (filling the additional data of the object too).
+        Computes and caches them if their inputs are unknown.
+
+        Args:
+            obj (ObjectInOrbit): the object
+
+        Returns:
+            dict: the covered percentage by day
+        """
+        key_hash = obj.get_keys_hash()
+        keys = self._db.get_keys(key_hash)
+        if keys is None:
+            cache = self.get_cache()
+            data = cache.get(key_hash) if cache else None
+            if data is not None:
+                keys = obj.set_derived_data(data)
+            else:
+                data = obj.get_derived_data()
+                keys = obj.set_derived_data(data)
+                if cache:
+                    cache.put(key_hash, data)
+            if not self._db.is_read_only():
+                self._new_keys[obj.get_name()] = (key_hash, keys)
+        return keys
+
+    def get_cache(self) ->DiskCache:
+        """Gets the cache of derived data shared by the projects, opens the user
+        cache on first call.
+
+        Returns:
+            DiskCache: the cache, None if disabled or if it cannot be created
+        """
+        if self._cache is None:
+            try:
+                self._cache = get_cache()
+            except OSError:
+                # e.g. a home directory without write access
+                self._cache = False
+        return self._cache or None
+
+    def _save_keys(self) ->None:
+        """Writes the keys computed since the last call to the database.
+        """
+        entries = [(key_hash, name, keys) for name, (key_hash, keys) in self._new_keys.items()]
+        self._new_keys = {}
+        self._db.put_keys(entries)
+
+    def build_object(self, elem:list, parent_mass:float=None):
+        """Initializes the backend object of an element.
+
+        Args:
+            elem (list): the physical and orbital characteristics
+            parent_mass (float, optional): the mass of the parent. Defaults to the mass
+                found in the database, or the solar mass.
+
+        Returns:
+            ObjectInOrbit | Star: the object
+        """
         if elem[1] == envs.T_STAR: #type
-            obj = Star(elem[0], elem[3], elem[2], self._children)
-        else:
+            return Star(elem[0], elem[3], elem[2], self._children)
+
+        if parent_mass is None:
             parent = self._db.find_object(elem[2])
             if parent:
-                parent_mass = parent[0][3]
+                parent_mass = parent[0].mass
             else:
                 parent_mass = envs.SOLAR_MASS
-            
-            obj = ObjectInOrbit(
+
+        return ObjectInOrbit(
                         object_name = elem[0],
                         object_type = elem[1],
                         object_parent = elem[2],
@@ -78,15 +309,33 @@ class Api():
                         random_perihelion_day = elem[11],
                         parent_mass = parent_mass
                         )
-            
-        self._db.insert_object(obj.read())
 
-        if not STANDALONE:
-            rig = Rig(obj, color=envs.COLORS[obj.get_type()])
-            if rebuild == False:
-                if rig._exists():
-                    return
-            rig.build()
+    def get_catalog(self) ->OrbitCatalog:
+        """Gets all the objects in orbit as arrays, to compute on all of them at once.
+
+        Returns:
+            OrbitCatalog: the catalog
+        """
+        return OrbitCatalog.from_rows(self._elements)
+
+    def check_swept_areas(self, n:int=50) ->dict:
+        """Diagnostics: checks Kepler's second law on the sampled orbits of all elements.
+
+        Args:
+            n (int, optional): nb of keyposes per orbit. Defaults to 50.
+
+        Returns:
+            dict: by object name, the spread of the swept areas (max - min) / mean
+        """
+        objects = [self.build_object(elem) for elem in self._children]
+        return get_swept_areas_deviation(objects, n)
+
+    def use_kepler_table(self) ->None:
+        """Solves Kepler's equation with a precomputed lookup table instead of iterating.
+        The table is saved next to the project database and reused on next openings.
+        """
+        name = os.path.basename(self._project_path)
+        kepler.use_table(os.path.join(self._project_path, f"{name}_kepler_table.npz"))
 
     def open_file(self, path:str) ->None:
         """If not standalone, opens a specified file
@@ -113,16 +362,99 @@ class Api():
             list: The elements
         """
         return self._db.read()
+
+    def iter_elements(self, columns:list=None, where:dict=None):
+        """Reads the database element by element, without loading all of it.
+
+        Args:
+            columns (list, optional): the envs column names to read. Defaults to all.
+            where (dict, optional): by column, the value to match. Defaults to None.
+
+        Yields:
+            tuple: the elements
+        """
+        return self._db.iter_rows(columns, where)
+
+    def read_names(self) ->list:
+        """Gets the names of all the elements.
+
+        Returns:
+            list[str]: the names
+        """
+        return [row[0] for row in self._db.iter_rows([envs.E_NAME])]
+
+    def search_names(self, text:str, limit:int=20) ->list:
+        """Gets the names of the elements containing a text, best matches first.
+
+        Args:
+            text (str): the text to search, e.g. "cer" or "1898 DQ"
+            limit (int, optional): nb of names. Defaults to 20.
+
+        Returns:
+            list[str]: the names
+        """
+        return self._db.search_names(text, limit)
+
+    def read_page(self, after:str=None, limit:int=100, columns:list=None, where:dict=None) ->list:
+        """Gets the elements sorted by name, one page at a time.
+
+        Args:
+            after (str, optional): the last name of the previous page. Defaults to the first page.
+            limit (int, optional): nb of elements per page. Defaults to 100.
+            columns (list, optional): the envs column names to read. Defaults to all.
+            where (dict, optional): by column, the value to match. Defaults to None.
+
+        Returns:
+            list: the elements
+        """
+        return self._db.read_page(after, limit, columns, where)
     
+    def find_by_perihelion(self, start:list, end:list) ->list:
+        """Gets the elements with a perihelion date in a range.
+
+        Args:
+            start (list[int]): the first date, [year, month, day], included
+            end (list[int]): the last date, [year, month, day], excluded
+
+        Returns:
+            list: The elements, sorted by perihelion date
+        """
+        return self._db.find_by_perihelion(float(epoch.julian_day(*start)),
+                                           float(epoch.julian_day(*end)))
+
+    def find_in_ranges(self, ranges:dict) ->list:
+        """Gets the elements whose characteristics are all in the given ranges.
+
+        Args:
+            ranges (dict): by envs column name, (min, max) bounds, both included. None for no bound.
+
+        Returns:
+            list: The elements
+        """
+        return self._db.find_in_ranges(ranges)
+
+    def find_overlapping(self, min_distance:float, max_distance:float=None,
+                         min_inclination:float=None, max_inclination:float=None) ->list:
+        """Gets the elements whose orbit, between perihelion and aphelion, overlaps a range
+        of distances from their parent (in AU), optionally within a range of inclinations (in deg).
+
+        Returns:
+            list: The elements
+        """
+        return self._db.find_overlapping(min_distance, max_distance, min_inclination, max_inclination)
+
     def delete_element(self, name:str) ->None:
-        """Deletes an element from its name, then reloads all
+        """Deletes an element from its name, then removes its 3D visualisation
+        and rebuilds the ones depending on it (see sync).
+        A read-only project cannot be deleted from, raises a RuntimeError.
 
         Args:
             name (str): The name of the element to delete.
         """
+        if self._db.is_read_only():
+            raise RuntimeError(f"Cannot delete '{name}', the project '{self._project_path}' is read-only.")
         self._db.delete_object(name)
-        self.reload()
-        self.build_all(rebuild=False)
+        self.sync()
     
 if __name__ == "__main__":
     pass
\ No newline at end of file
@@ -1,5 +1,9 @@
-import math
-from orbit import envs, utils
+import math, hashlib
+import numpy as np
+from orbit import envs, utils, kepler, epoch
+
+# change it when get_adaptive_keys gives other keys for the same inputs
+KEYS_VERSION = 1
 
 class ObjectInOrbit():
     """This class initializes an object in orbit. From specified data, does the calculation
@@ -20,6 +24,20 @@ class ObjectInOrbit():
             random_perihelion_day (list[int]): a random perihelion or perigee day
             parent_mass (float): the mass of the parent
         """
+    # additional data, left unset until first access
+    _DERIVED = ("_semi_minor_axis", "_orbital_period", "_orbital_circumference",
+                "_perihelion_distance", "_perihelion_velocity",
+                "_aphelion_distance", "_aphelion_velocity")
+    # by constructor argument, the attribute storing it
+    _ELEMENTS = {"object_name" : "_name", "object_type" : "_type", "object_parent" : "_parent",
+                 "object_mass" : "_mass", "rotation_period" : "_rotation_period",
+                 "axis_inclination" : "_axis_inclination", "semi_major_axis" : "_semi_major_axis",
+                 "inclination" : "_inclination", "eccentricity" : "_eccentricity",
+                 "ascending_node" : "_ascending_node", "arg_periapsis" : "_arg_periapsis",
+                 "random_perihelion_day" : "_perihelion_day", "parent_mass" : "_parent_mass"}
+
+    __slots__ = tuple(_ELEMENTS.values()) + _DERIVED
+
     def __init__(self, object_name:str, object_type:str, object_parent:str,
                 object_mass:float, rotation_period:float, axis_inclination:float,
                 semi_major_axis:float, inclination:float, eccentricity:float,
@@ -48,13 +66,22 @@ class ObjectInOrbit():
         self._perihelion_day = random_perihelion_day
         self._arg_periapsis = arg_periapsis
         self._ascending_node = ascending_node
-        self._semi_minor_axis = self.set_semi_minor_axis()
-        self._orbital_period = self.set_orbital_period()
-        self._orbital_circumference = self.set_orbital_circumference()
-        self._perihelion_distance = self.set_perihelion_distance()
-        self._perihelion_velocity = self.set_perihelion_velocity()
-        self._aphelion_distance = self.set_aphelion_distance()
-        self._aphelion_velocity = self.set_aphelion_velocity()
+
+    def update(self, **elements) ->None:
+        """Changes some characteristics of the object. The additional data
+        will be calculated again when needed.
+
+        Args:
+            elements: new values, named like the constructor arguments (e.g. eccentricity=0.1)
+        """
+        for key, value in elements.items():
+            if key not in self._ELEMENTS:
+                raise RuntimeError(f"Unknown characteristic '{key}'")
+            setattr(self, self._ELEMENTS[key], value)
+
+        for name in self._DERIVED:
+            if hasattr(self, name):
+                delattr(self, name)
 
     def __repr__(self) -> str:
         return f"""
@@ -64,17 +91,17 @@ class ObjectInOrbit():
 
         # ORBITAL CHARACTERISTICS
         semi major axis : {self._semi_major_axis} AU
-        semi minor axis : {self._semi_minor_axis} AU
+        semi minor axis : {self.get_semi_minor_axis()} AU
         inclination : {self._inclination}°
         eccentricity : {self._eccentricity}
-        period : {self._orbital_period} days
-        circumference : {self._orbital_circumference} m
+        period : {self.get_orbital_period()} days
+        circumference : {self.get_orbital_circumference()} m
         ascending node : {self._ascending_node}°
         argument of periapsis : {self._arg_periapsis}°
-        distance at perihelion : {self._perihelion_distance} AU
-        velocity at perihelion : {self._perihelion_velocity} m/s
-        distance at aphelion : {self._aphelion_distance} AU
-        velocity at aphelion : {self._aphelion_velocity} m/s
+        distance at perihelion : {self.get_perihelion_distance()} AU
+        velocity at perihelion : {self.get_perihelion_velocity()} m/s
+        distance at aphelion : {self.get_aphelion_distance()} AU
+        velocity at aphelion : {self.get_aphelion_velocity()} m/s
 
         # PHYSICAL CHARACTERISTICS
         type : {self._type}
@@ -102,6 +129,7 @@ class ObjectInOrbit():
             envs.O_ASCENDING_NODE : self.get_ascending_node(),
             envs.O_ARG_PERIAPSIS : self.get_arg_periapsis(),
             envs.O_PERIHELION_DAY : self.get_random_perihelion_day(),
+            envs.O_PERIHELION_JD : self.get_perihelion_julian_day(),
             envs.O_SEMI_MINOR_AXIS : self.get_semi_minor_axis(),
             envs.O_PERIOD : self.get_orbital_period(),
             envs.O_CIRCUMFERENCE : self.get_orbital_circumference(),
@@ -189,7 +217,11 @@ class ObjectInOrbit():
         Returns:
             float: the orbital period in days
         """
-        return self._orbital_period
+        try:
+            return self._orbital_period
+        except AttributeError:
+            self._orbital_period = self.set_orbital_period()
+            return self._orbital_period
     
     def get_random_perihelion_day(self) ->list:
         """Gets a perihelion day
@@ -197,9 +229,7 @@ class ObjectInOrbit():
         Returns:
             float: the day
         """
-        if not isinstance(self._perihelion_day, list):
-            return eval(self._perihelion_day)
-        return self._perihelion_day
+        return epoch.parse_date(self._perihelion_day)
     
     def get_arg_periapsis(self) ->float:
         """Gets the argument of periapsis
@@ -234,7 +264,11 @@ class ObjectInOrbit():
         Returns:
             float: axis
         """
-        return self._semi_minor_axis
+        try:
+            return self._semi_minor_axis
+        except AttributeError:
+            self._semi_minor_axis = self.set_semi_minor_axis()
+            return self._semi_minor_axis
     
     def set_semi_minor_axis(self) ->float:
         """Calculates the semi minor axis of an ellipse.
@@ -245,13 +279,21 @@ class ObjectInOrbit():
         return self._semi_major_axis * math.sqrt(1 - self._eccentricity ** 2)
 
     def get_perihelion_distance(self) ->float:
-        return self._perihelion_distance
+        try:
+            return self._perihelion_distance
+        except AttributeError:
+            self._perihelion_distance = self.set_perihelion_distance()
+            return self._perihelion_distance
     
     def set_perihelion_distance(self) ->float:
         return self._semi_major_axis * (1 - self._eccentricity)
 
     def get_perihelion_velocity(self) ->float:
-        return self._perihelion_velocity
+        try:
+            return self._perihelion_velocity
+        except AttributeError:
+            self._perihelion_velocity = self.set_perihelion_velocity()
+            return self._perihelion_velocity
     
     def set_perihelion_velocity(self) ->float:
         """Calculate the speed of an object at perihelion around the Sun
@@ -259,16 +301,24 @@ class ObjectInOrbit():
         Returns:
             float: The velocity in meters
         """
-        return math.sqrt(envs.G * (self._parent_mass + self._mass) * (2 / utils.convert_au_to_meters(self._perihelion_distance) - 1 / utils.convert_au_to_meters(self._semi_major_axis)))
+        return math.sqrt(envs.G * (self._parent_mass + self._mass) * (2 / utils.convert_au_to_meters(self.get_perihelion_distance()) - 1 / utils.convert_au_to_meters(self._semi_major_axis)))
 
     def get_aphelion_distance(self) ->float:
-        return self._aphelion_distance
+        try:
+            return self._aphelion_distance
+        except AttributeError:
+            self._aphelion_distance = self.set_aphelion_distance()
+            return self._aphelion_distance
     
     def set_aphelion_distance(self) ->float:
         return self._semi_major_axis * (1 + self._eccentricity)
     
     def get_aphelion_velocity(self) ->float:
-        return self._aphelion_velocity
+        try:
+            return self._aphelion_velocity
+        except AttributeError:
+            self._aphelion_velocity = self.set_aphelion_velocity()
+            return self._aphelion_velocity
     
     def set_aphelion_velocity(self) ->float:
         """Calculate the speed of an object at aphelion around the Sun
@@ -276,10 +326,14 @@ class ObjectInOrbit():
         Returns:
             float: The velocity in meters
         """
-        return math.sqrt(envs.G * (self._parent_mass + self._mass) * (2 / utils.convert_au_to_meters(self._aphelion_distance) - 1 / utils.convert_au_to_meters(self._semi_major_axis)))
+        return math.sqrt(envs.G * (self._parent_mass + self._mass) * (2 / utils.convert_au_to_meters(self.get_aphelion_distance()) - 1 / utils.convert_au_to_meters(self._semi_major_axis)))
 
     def get_orbital_circumference(self) ->float:
-        return self._orbital_circumference
+        try:
+            return self._orbital_circumference
+        except AttributeError:
+            self._orbital_circumference = self.set_orbital_circumference()
+            return self._orbital_circumference
     
     def set_orbital_circumference(self) ->float:
         return 2 * math.pi * (self._semi_major_axis * envs.AU) # in meters
@@ -289,10 +343,10 @@ class ObjectInOrbit():
         # radius = perihelion distance at first
 
         # Kepler's law
-        orbital_speed = (2 * math.pi * radius) / self._orbital_period
+        orbital_speed = (2 * math.pi * radius) / self.get_orbital_period()
 
         # percentage of covered distance
-        return self._orbital_circumference / 100 * (orbital_speed * time)
+        return self.get_orbital_circumference() / 100 * (orbital_speed * time)
     
     def get_days(self) ->int:
         """Returns the number of days from J2000 to the specified perihelion date.
@@ -302,110 +356,254 @@ class ObjectInOrbit():
                                     int(perihelion_day[1]),
                                     int(perihelion_day[2])))
         
+    def get_perihelion_julian_day(self) ->float:
+        """Gets the Julian day of the specified perihelion date, at 00:00 UTC.
+        """
+        perihelion_day = self.get_random_perihelion_day()
+        return float(epoch.julian_day(int(perihelion_day[0]),
+                                      int(perihelion_day[1]),
+                                      int(perihelion_day[2])))
+
+    def positions_at(self, julian_days) ->tuple:
+        """Gets the state vectors of the object at several dates.
+        The vectors are relative to the parent (heliocentric if the parent is "Origin"),
+        in the ecliptic frame: X points to the vernal point, Z to the ecliptic north pole.
+
+        Args:
+            julian_days (array_like): the dates, as Julian days
+
+        Returns:
+            tuple: (positions in AU, velocities in AU/day), shape (..., 3)
+        """
+        mean_motion = 2 * math.pi / self.get_orbital_period()
+        mean_anomaly = mean_motion * (np.asarray(julian_days, dtype=np.float64) - self.get_perihelion_julian_day())
+        return kepler.state_vectors(self._semi_major_axis,
+                                    self._eccentricity,
+                                    math.radians(self._inclination),
+                                    math.radians(self._ascending_node),
+                                    math.radians(self._arg_periapsis),
+                                    mean_anomaly,
+                                    mean_motion)
+
+    def position_at(self, julian_day:float) ->tuple:
+        """Gets the state vector of the object at a date. See positions_at.
+
+        Args:
+            julian_day (float): the date, as a Julian day
+
+        Returns:
+            tuple: (position in AU, velocity in AU/day), arrays of 3 floats
+        """
+        return self.positions_at(float(julian_day))
+
     def get_covered_distance_each_day(self) ->dict:
-        def find_root(x, e, M):
-            return x - e * math.sin(x) - M
-        
-        t,M,u,theta,R,X,Y = [],[],[],[],[],[],[]
+        N = 50 # nb of keyposes
+        return get_covered_distances([self], N)[0]
+
+    def get_adaptive_keys(self, tolerance:float=None, samples:int=4096) ->dict:
+        """Gets the covered percentage of the orbit at the fewest dates needed
+        to stay within a positional error, when interpolating linearly between keys.
+        Keys are dense near periapsis, where the object is fast, and sparse near apoapsis.
+        The last key closes the revolution at 100%.
+
+        Args:
+            tolerance (float, optional): the allowed error in AU. Defaults to 0.1% of the semi major axis.
+            samples (int, optional): nb of reference positions along the orbit. Defaults to 4096.
 
-        T_rev = self._orbital_period / 365 #orbital period (year)
+        Returns:
+            dict: the covered percentage by day
+        """
+        if tolerance is None:
+            tolerance = self._semi_major_axis * 1e-3
+
+        # uniform steps of eccentric anomaly are already denser in time at periapsis
         e = self._eccentricity
-        a = self._semi_major_axis
-        N = 50 # nb of keyposes
+        E = np.linspace(0, 2 * np.pi, samples + 1)
+        times = (E - e * np.sin(E)) / (2 * np.pi) * self.get_orbital_period()
+        X = self._semi_major_axis * (np.cos(E) - e)
+        Y = self.get_semi_minor_axis() * np.sin(E)
+        arc = np.zeros_like(E)
+        arc[1:] = np.cumsum(np.hypot(np.diff(X), np.diff(Y)))
+
+        keys = simplify_keys(times, arc, tolerance)
+        values = arc[keys] / arc[-1] * 100
 
-        # calculate the date at each N
-        times_inc = []
-        time_inc = T_rev / N
-        for i in range(N):
-            times_inc.append(time_inc*i)
-        # times_inc.append(T_rev)
-
-        # Kepler
-        # Find where is the object
-        for i in range(N):
-            t.append(i*time_inc)
-            M.append(2*math.pi/T_rev *t[i])
-            x = 0
-            max_iterations = 1000  #l ambda number
-
-            # Newton-Raphson method to find the root
-            for _ in range(max_iterations):
-                f_x = find_root(x, e, M[i])
-                f_prime_x = 1 - e * math.cos(x)
-                x = x - f_x / f_prime_x
-            u.append(x)
-        # polar coordinates
-            theta.append(2*math.atan((math.sqrt((1+e)/ (1-e))*math.tan(u[i]/2))))
-            R.append(a*(1-e**2)/(1+e*math.cos(theta[i]))) 
-        # cartesian coordinates
-            X.append(R[i]*math.cos(theta[i])) 
-            Y.append(R[i]*math.sin(theta[i]))
-
-        # t1,t2 = first area dates and t2, t3 = second aera dates
-        t1,t2 = 0,2
-        t3,t4 = 10,12
-        # positions may change but space between dates must be the same
-
-        AIRE1,AIRE2 = 0,0
-        i1,i2 = 0,0 
-
-        # calculation of swept area between t1 and t2
-        Delta_t1 =t2-t1
-        for i1 in range(Delta_t1):
-            # calculate the length of triangle sides
-            long1 = math.sqrt((X[t1+i1])**2+(Y[t1+i1])**2)
-            long2 = math.sqrt((X[t2+i1])**2+(Y[t2+i1])**2)
-            long3 = math.sqrt((X[t2+i1]-X[t1+i1])**2+(Y[t2+i1]-Y[t1+i1])**2) 
-            # half perimeter
-            S_1 = 1/2*(long1+long2+long3)
-            # Heron formula
-            AIRE1 = math.sqrt(S_1*(S_1-long1)*(S_1-long2)*(S_1-long3))+AIRE1
-            
-        # calculation of swept area between t3 and t4
-        Delta_t2 =t4-t3
-
-        for i2 in range(Delta_t2):
-            # calculate the length of triangle sides
-            long1b = math.sqrt((X[t3+i2])**2+(Y[t3+i2])**2)
-            long2b = math.sqrt((X[t4+i2])**2+(Y[t4+i2])**2)
-            long3b = math.sqrt((X[t4+i2]-X[t3+i2])**2+(Y[t4+i2]-Y[t3+i2])**2)
-            #half perimeter
-            S_1b = 1/2*(long1b+long2b+long3b)
-            # Heron formula
-            AIRE2 = math.sqrt(S_1b*(S_1b-long1b)*(S_1b-long2b)*(S_1b-long3b)) +AIRE2
-
-        # Join points in tuple
-        points = []
-        for x,y in zip(X,Y):
-            points.append((x,y))
-
-        # distance between points
-        def distance_between_points(point1, point2):
-            x1, y1 = point1
-            x2, y2 = point2
-            return math.sqrt((x2 - x1)**2 + (y2 - y1)**2)
-
-        distances = []
-        # distance between consecutive points
-        for i in range(len(points) - 1):
-            dist = distance_between_points(points[i], points[i + 1])
-            distances.append(dist)
-
-        # calculate percentage of distance done
-        total = 0
-        sum_distances = sum(distances)
-        values = [0]
-        for i, dist in enumerate(distances):
-            cross_product = dist * 100 / sum_distances
-            total += cross_product
-            values.append(total)
-
-        data = {}
         days = self.get_days()
-        for time, value in zip(times_inc,values):
-            data[days + time*365] = value
-        
-        return data
+        return {days + time : value for time, value in zip(times[keys].tolist(), values.tolist())}
+
+    def get_keys_hash(self, tolerance:float=None, samples:int=4096) ->str:
+        """Gets a hash of everything the derived data depends on: the orbital elements,
+        the masses, the sampling settings and the versions of the algorithms.
+        Same hash, same keys and same additional data.
+
+        Returns:
+            str: the hexadecimal hash
+        """
+        if tolerance is None:
+            tolerance = self._semi_major_axis * 1e-3
+        inputs = (KEYS_VERSION, kepler.VERSION, self._semi_major_axis, self._inclination,
+                  self._eccentricity, self._ascending_node, self._arg_periapsis,
+                  list(self.get_random_perihelion_day()), self._mass, self._parent_mass,
+                  tolerance, samples)
+        return hashlib.sha1(repr(inputs).encode()).hexdigest()
+
+    def get_derived_data(self, tolerance:float=None, samples:int=4096) ->dict:
+        """Gets all the computed data of the object as arrays, to be cached:
+        the additional data, the adaptive keys and the state vectors at the key dates.
+
+        Returns:
+            dict: "derived" (values ordered like _DERIVED), "keys" (days, values),
+                "positions" and "velocities" (in AU and AU/day, shape (K, 3))
+        """
+        keys = self.get_adaptive_keys(tolerance, samples)
+        days = np.array(list(keys), dtype=np.float64)
+        # key days are counted from J2000 at 00:00
+        positions, velocities = self.positions_at(days + envs.J2000 + 0.5)
+        derived = [self.get_semi_minor_axis(), self.get_orbital_period(), self.get_orbital_circumference(),
+                   self.get_perihelion_distance(), self.get_perihelion_velocity(),
+                   self.get_aphelion_distance(), self.get_aphelion_velocity()]
+        return {"derived" : np.array(derived, dtype=np.float64),
+                "keys" : np.array([days, list(keys.values())], dtype=np.float64),
+                "positions" : positions,
+                "velocities" : velocities}
+
+    def set_derived_data(self, data:dict) ->dict:
+        """Uses cached data instead of computing it (see get_derived_data).
+
+        Args:
+            data (dict): the arrays, from get_derived_data
+
+        Returns:
+            dict: the adaptive keys
+        """
+        for name, value in zip(self._DERIVED, data["derived"].tolist()):
+            setattr(self, name, value)
+        days, values = data["keys"]
+        return dict(zip(days.tolist(), values.tolist()))
+
+def simplify_keys(times:np.ndarray, values:np.ndarray, tolerance:float) ->np.ndarray:
+    """Selects the keys needed to rebuild a curve by linear interpolation
+    without moving more than the tolerance from it (Douglas-Peucker on the values).
+
+    Args:
+        times (np.ndarray): the increasing dates of the reference samples
+        values (np.ndarray): the reference values
+        tolerance (float): the allowed error, in the unit of the values
+
+    Returns:
+        np.ndarray: the sorted indices of the kept samples, first and last included
+    """
+    keep = np.zeros(len(times), dtype=bool)
+    keep[[0, -1]] = True
+    segments = [(0, len(times) - 1)]
+    while segments:
+        first, last = segments.pop()
+        if last - first < 2:
+            continue
+        t = times[first:last + 1]
+        line = values[first] + (values[last] - values[first]) * (t - t[0]) / (t[-1] - t[0])
+        errors = np.abs(values[first:last + 1] - line)
+        worst = int(np.argmax(errors))
+        if errors[worst] > tolerance:
+            keep[first + worst] = True
+            segments.append((first, first + worst))
+            segments.append((first + worst, last))
+
+    return np.flatnonzero(keep)
+
+def sample_orbits(objects:list, n:int=50) ->tuple:
+    """Samples the orbits of several objects in a single Kepler solve.
+    Each orbit is cut in n equal time steps, starting at perihelion.
+
+    Args:
+        objects (list[ObjectInOrbit]): the objects to sample
+        n (int, optional): nb of keyposes per orbit. Defaults to 50.
+
+    Returns:
+        tuple: (times in years, X, Y) arrays of shape (len(objects), n)
+    """
+    T_rev = np.array([obj.get_orbital_period() for obj in objects]) / 365 #orbital period (year)
+    e = np.array([obj.get_eccentricity() for obj in objects], dtype=np.float64)[:, np.newaxis]
+    a = np.array([obj.get_semi_major_axis() for obj in objects], dtype=np.float64)[:, np.newaxis]
+
+    # calculate the date at each n
+    times_inc = (T_rev / n)[:, np.newaxis] * np.arange(n)
+    M = 2 * np.pi * np.arange(n) / n * np.ones_like(e)
+
+    # Kepler
+    # Find where is the object
+    _, theta, R = kepler.solve(e, M, a)
+    # cartesian coordinates
+    return times_inc, R * np.cos(theta), R * np.sin(theta)
+
+def covered_percentages(X:np.ndarray, Y:np.ndarray) ->np.ndarray:
+    """Calculates the percentage of the orbit covered at each sampled point.
+
+    Args:
+        X (np.ndarray): x coordinates, shape (nb of objects, nb of keyposes)
+        Y (np.ndarray): y coordinates, same shape
+
+    Returns:
+        np.ndarray: the cumulated percentages, starting at 0
+    """
+    # distance between consecutive points
+    distances = np.hypot(np.diff(X, axis=1), np.diff(Y, axis=1))
+    values = np.zeros_like(X)
+    values[:, 1:] = np.cumsum(distances, axis=1) * 100 / distances.sum(axis=1, keepdims=True)
+    return values
+
+def get_swept_areas_deviation(objects:list, n:int=50) ->dict:
+    """Checks Kepler's second law on the sampled orbits: the areas swept
+    between consecutive keyposes (equal times) should all be the same.
+    The areas are the exact elliptic sectors between the sampled positions,
+    the result is the deviation of the samples used by the keyframes.
+    Diagnostics only, the keyframe path does not need it.
+
+    Args:
+        objects (list[ObjectInOrbit]): the objects to check
+        n (int, optional): nb of keyposes per orbit. Defaults to 50.
+
+    Returns:
+        dict: by object name, the spread of the swept areas (max - min) / mean
+    """
+    if not objects:
+        return {}
+    _, X, Y = sample_orbits(objects, n)
+    e = np.array([obj.get_eccentricity() for obj in objects], dtype=np.float64)[:, np.newaxis]
+    a = np.array([obj.get_semi_major_axis() for obj in objects], dtype=np.float64)[:, np.newaxis]
+    b = np.array([obj.get_semi_minor_axis() for obj in objects], dtype=np.float64)[:, np.newaxis]
+
+    # eccentric anomaly of each sampled position: X = a(cos E - e), Y = b sin E
+    E = np.unwrap(np.arctan2(Y / b, X / a + e), axis=1)
+    # the last sector closes the orbit
+    E = np.concatenate([E, E[:, :1] + 2 * np.pi], axis=1)
+    areas = a * b / 2 * np.diff(E - e * np.sin(E), axis=1)
+    deviations = (areas.max(axis=1) - areas.min(axis=1)) / areas.mean(axis=1)
+
+    return {obj.get_name() : deviation for obj, deviation in zip(objects, deviations.tolist())}
+
+def get_covered_distances(objects:list, n:int=50) ->list:
+    """Batch version of ObjectInOrbit.get_covered_distance_each_day.
+
+    Args:
+        objects (list[ObjectInOrbit]): the objects to sample
+        n (int, optional): nb of keyposes per orbit. Defaults to 50.
+
+    Returns:
+        list[dict]: for each object, the covered percentage by day
+    """
+    if not objects:
+        return []
+    times_inc, X, Y = sample_orbits(objects, n)
+    values = covered_percentages(X, Y)
+
+    dates = epoch.parse_dates([obj._perihelion_day for obj in objects])
+    all_days = epoch.days_from_j2000(dates[:, 0], dates[:, 1], dates[:, 2]).tolist()
+
+    result = []
+    for days, times, obj_values in zip(all_days, times_inc.tolist(), values.tolist()):
+        result.append({days + time*365 : value for time, value in zip(times, obj_values)})
+    return result
     
 class Star():
     def __init__(self, name:str, mass:str, parent:str=envs.ORIGIN, children:list=[]) -> None:
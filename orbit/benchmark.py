@@ -0,0 +1,64 @@
+import os, time, tempfile
+from orbit.database import Database
+from orbit import envs
+
+def timed(function, *args) ->float:
+    """Runs a function and measures it
+
+    Returns:
+        float: the duration in seconds
+    """
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+def fill_database(db:Database, count:int) ->list:
+    """Inserts dummy asteroids in a database
+
+    Args:
+        db (Database): the database
+        count (int): nb of objects
+
+    Returns:
+        list[str]: the names
+    """
+    names = [f"{i}'Asteroid" for i in range(count)]
+    db.insert_objects({envs.E_NAME : name,
+                       envs.E_TYPE : envs.T_ASTEROID,
+                       envs.E_PARENT : envs.ORIGIN,
+                       envs.E_MASS : 1e15} for name in names)
+    return names
+
+def bench_find_object(calls:int=100000, objects:int=10000) ->None:
+    """Measures the lookup throughput of Database.find_object, and compares it
+    with the same lookups written with f-strings (each one compiled again by SQLite).
+
+    Args:
+        calls (int, optional): nb of lookups. Defaults to 100000.
+        objects (int, optional): nb of objects in the database. Defaults to 10000.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        project = os.path.join(directory, "benchmark")
+        os.mkdir(project)
+        db = Database(project)
+        names = fill_database(db, objects)
+        lookups = [names[i % objects] for i in range(calls)]
+
+        def parameterized():
+            for name in lookups:
+                db.find_object(name)
+
+        def formatted():
+            cursor = db._cursor
+            for name in lookups:
+                escaped = name.replace("'", "''")
+                cursor.execute(f"SELECT * FROM {db._name} WHERE [{envs.E_NAME}] = '{escaped}'")
+                cursor.fetchall()
+
+        for label, function in (("parameterized", parameterized), ("f-string", formatted)):
+            duration = timed(function)
+            print(f"find_object {label:>13} : {calls / duration:>10.0f} lookups/s ({duration:.2f} s)")
+        db.close()
+
+if __name__ == "__main__":
+    bench_find_object()
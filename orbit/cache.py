@@ -0,0 +1,145 @@
+import os, tempfile, threading
+import numpy as np
+
+# user-level directory, shared by all the projects
+DIRECTORY = os.environ.get("ORBIT_CACHE_DIR",
+                           os.path.join(os.path.expanduser("~"), ".orbit", "cache"))
+MAX_SIZE = 256 * 1024 ** 2 # bytes
+
+class DiskCache():
+    """This class stores derived data as .npz files named by the hash of their inputs,
+    so every project computing the same object gets the same file.
+    Files are written to a temporary file then renamed, a reader never sees a partial file.
+    Above max_size, the least recently read files are removed.
+
+        Args:
+            directory (str, optional): the cache directory. Defaults to DIRECTORY.
+            max_size (int, optional): the size limit in bytes. Defaults to MAX_SIZE.
+        """
+    def __init__(self, directory:str=None, max_size:int=MAX_SIZE) -> None:
+        self._directory = directory or DIRECTORY
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        os.makedirs(self._directory, exist_ok=True)
+        self._size = sum(os.path.getsize(path) for path in self._iter_files())
+
+    def _iter_files(self):
+        for root, _, files in os.walk(self._directory):
+            for file in files:
+                if file.endswith(".npz"):
+                    yield os.path.join(root, file)
+
+    def get_directory(self) ->str:
+        return self._directory
+
+    def get_size(self) ->int:
+        """Gets the size of the cached files in bytes
+        """
+        return self._size
+
+    def get_path(self, key:str) ->str:
+        # two levels, to keep the directories small
+        return os.path.join(self._directory, key[:2], f"{key}.npz")
+
+    def get(self, key:str) ->dict:
+        """Gets cached data.
+
+        Args:
+            key (str): the hash of the inputs
+
+        Returns:
+            dict: the arrays by name, None if not cached
+        """
+        path = self.get_path(key)
+        if not os.path.isfile(path):
+            return None
+        try:
+            with np.load(path) as data:
+                arrays = {name : data[name] for name in data.files}
+            # the access time is the modification time, noatime file systems are common
+            os.utime(path)
+        except Exception:
+            # truncated or corrupt (e.g. zipfile.BadZipFile): a miss, written again later
+            self.remove(key)
+            return None
+        return arrays
+
+    def remove(self, key:str) ->None:
+        path = self.get_path(key)
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            self._size -= size
+
+    def put(self, key:str, arrays:dict) ->None:
+        """Caches data, then removes the oldest files if the cache is too big.
+
+        Args:
+            key (str): the hash of the inputs
+            arrays (dict): the arrays by name
+        """
+        path = self.get_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handle, temp_path = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(path))
+        try:
+            with os.fdopen(handle, "wb") as file:
+                np.savez(file, **arrays)
+            size = os.path.getsize(temp_path)
+            old_size = os.path.getsize(path) if os.path.isfile(path) else 0
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+        with self._lock:
+            self._size += size - old_size
+        if self._size > self._max_size:
+            self.evict()
+
+    def evict(self) ->None:
+        """Removes the least recently used files until the cache is 10% under its limit.
+        """
+        with self._lock:
+            files = []
+            for path in self._iter_files():
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+            self._size = sum(file[1] for file in files)
+
+            target = self._max_size * 0.9
+            for _, size, path in sorted(files):
+                if self._size <= target:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                self._size -= size
+
+    def clear(self) ->None:
+        with self._lock:
+            for path in list(self._iter_files()):
+                os.remove(path)
+            self._size = 0
+
+_CACHE = None
+
+def get_cache() ->DiskCache:
+    """Gets the cache of the process, in the user directory.
+
+    Returns:
+        DiskCache: the cache
+    """
+    global _CACHE
+    if _CACHE is None:
+        _CACHE = DiskCache()
+    return _CACHE
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,240 @@
+import numpy as np
+from orbit import envs, kepler, epoch
+
+# stored columns and their dtype
+COLUMNS = {
+    envs.E_MASS : np.float64,
+    envs.E_PERIOD : np.float32,
+    envs.E_INCLINATION : np.float32,
+    envs.O_SEMI_MAJOR_AXIS : np.float64,
+    envs.O_INCLINATION : np.float64,
+    envs.O_ECCENTRICITY : np.float64,
+    envs.O_ASCENDING_NODE : np.float64,
+    envs.O_ARG_PERIAPSIS : np.float64,
+}
+
+class OrbitCatalog():
+    """This class stores the physical and orbital characteristics of many objects
+    as one typed array per characteristic, and calculates the additional data
+    of ObjectInOrbit for all of them at once.
+
+        Args:
+            names (list[str]): the names of the objects
+            types (list[str]): the types (planet, asteroid...)
+            parents (list[str]): the parents. If it's the barycenter (or a star), "Origin"
+            columns (dict): by envs column name, the values of each object
+            perihelion_julian_days (array_like): the Julian days of a perihelion date
+            parent_masses (array_like, optional): the parent masses. Defaults to the parent
+                mass in the catalog, or the solar mass.
+        """
+    def __init__(self, names:list, types:list, parents:list, columns:dict,
+                 perihelion_julian_days, parent_masses=None) -> None:
+        self._names = list(names)
+        self._index = {name : i for i, name in enumerate(self._names)}
+        if len(self._index) != len(self._names):
+            raise RuntimeError("Object names must be unique in a catalog.")
+
+        type_index = {typ : i for i, typ in enumerate(envs.TYPES)}
+        self._types = np.array([type_index[typ] for typ in types], dtype=np.int8)
+        # -1 is the origin, or a parent out of the catalog
+        self._parents = np.array([self._index.get(parent, -1) for parent in parents], dtype=np.int32)
+        self._parent_names = [parent for parent, i in zip(parents, self._parents) if i == -1]
+
+        self._columns = {}
+        for column, dtype in COLUMNS.items():
+            self._columns[column] = np.ascontiguousarray(columns[column], dtype=dtype)
+        self._perihelion_julian_days = np.ascontiguousarray(perihelion_julian_days, dtype=np.float64)
+
+        if parent_masses is None:
+            masses = self._columns[envs.E_MASS]
+            parent_masses = np.where(self._parents >= 0, masses[self._parents], envs.SOLAR_MASS)
+        self._parent_masses = np.ascontiguousarray(parent_masses, dtype=np.float64)
+
+    @classmethod
+    def from_rows(cls, rows:list) ->"OrbitCatalog":
+        """Creates a catalog from elements ordered like the database columns. Stars are skipped,
+        but their masses are used for the objects orbiting them.
+
+        Args:
+            rows (list): the elements, as returned by Database.read
+
+        Returns:
+            OrbitCatalog: the catalog
+        """
+        rows = list(rows)
+        # parent masses from all the rows, like Api.build_object
+        masses = {row[0] : row[3] for row in rows}
+        rows = [row for row in rows if row[1] != envs.T_STAR]
+        parent_masses = [masses.get(row[2], envs.SOLAR_MASS) for row in rows]
+        values = list(zip(*rows)) or [()] * 12
+        if len(values) > 19 and None not in values[19]:
+            # stored Julian days, no date to parse
+            perihelion_julian_days = values[19]
+        else:
+            dates = epoch.parse_dates(values[11])
+            perihelion_julian_days = epoch.julian_day(dates[:, 0], dates[:, 1], dates[:, 2])
+
+        columns = {column : values[3 + i] for i, column in enumerate(COLUMNS)}
+        return cls(values[0], values[1], values[2], columns, perihelion_julian_days, parent_masses)
+
+    def __len__(self) ->int:
+        return len(self._names)
+
+    def __contains__(self, name:str) ->bool:
+        return name in self._index
+
+    def index(self, name:str) ->int:
+        """Gets the position of an object in the arrays
+
+        Args:
+            name (str): the name of the object
+
+        Returns:
+            int: the index
+        """
+        return self._index[name]
+
+    def get_names(self) ->list:
+        return self._names
+
+    def get_types(self) ->list:
+        return [envs.TYPES[i] for i in self._types]
+
+    def get_parents(self) ->list:
+        """Gets the parent names. If barycenter, "Origin".
+
+        Returns:
+            list: the parents
+        """
+        outside = iter(self._parent_names)
+        return [self._names[i] if i >= 0 else next(outside) for i in self._parents]
+
+    def get(self, column:str) ->np.ndarray:
+        """Gets the values of a stored characteristic for all the objects
+
+        Args:
+            column (str): an envs column name, e.g. envs.O_ECCENTRICITY
+
+        Returns:
+            np.ndarray: the values
+        """
+        return self._columns[column]
+
+    def get_perihelion_julian_days(self) ->np.ndarray:
+        """Gets the Julian days of the specified perihelion dates.
+        """
+        return self._perihelion_julian_days
+
+    def get_parent_masses(self) ->np.ndarray:
+        return self._parent_masses
+
+    def get_semi_minor_axis(self) ->np.ndarray:
+        a = self._columns[envs.O_SEMI_MAJOR_AXIS]
+        return a * np.sqrt(1 - self._columns[envs.O_ECCENTRICITY] ** 2)
+
+    def get_orbital_period(self) ->np.ndarray:
+        """Calculates the orbital periods in days, with Kepler's law.
+        """
+        a = self._columns[envs.O_SEMI_MAJOR_AXIS] * envs.AU
+        return 2 * np.pi * np.sqrt(a**3 / (envs.G * self._parent_masses)) / 86400
+
+    def get_orbital_circumference(self) ->np.ndarray:
+        return 2 * np.pi * (self._columns[envs.O_SEMI_MAJOR_AXIS] * envs.AU) # in meters
+
+    def get_perihelion_distance(self) ->np.ndarray:
+        return self._columns[envs.O_SEMI_MAJOR_AXIS] * (1 - self._columns[envs.O_ECCENTRICITY])
+
+    def get_aphelion_distance(self) ->np.ndarray:
+        return self._columns[envs.O_SEMI_MAJOR_AXIS] * (1 + self._columns[envs.O_ECCENTRICITY])
+
+    def get_velocity(self, distance:np.ndarray) ->np.ndarray:
+        """Calculates the speeds at the given distances from the parent (vis-viva equation)
+
+        Args:
+            distance (np.ndarray): the distances in AU
+
+        Returns:
+            np.ndarray: the velocities in m/s
+        """
+        mu = envs.G * (self._parent_masses + self._columns[envs.E_MASS])
+        a = self._columns[envs.O_SEMI_MAJOR_AXIS] * envs.AU
+        return np.sqrt(mu * (2 / (distance * envs.AU) - 1 / a))
+
+    def get_perihelion_velocity(self) ->np.ndarray:
+        return self.get_velocity(self.get_perihelion_distance())
+
+    def get_aphelion_velocity(self) ->np.ndarray:
+        return self.get_velocity(self.get_aphelion_distance())
+
+    def get_levels(self) ->np.ndarray:
+        """Gets the depth of each object in the parent tree: 0 around the origin,
+        1 for their satellites...
+
+        Returns:
+            np.ndarray: the levels
+        """
+        levels = np.where(self._parents < 0, 0, -1)
+        level = 0
+        while (levels < 0).any():
+            level += 1
+            resolved = (levels < 0) & (levels[np.maximum(self._parents, 0)] == level - 1)
+            if not resolved.any():
+                raise RuntimeError("The parents of the catalog make a loop.")
+            levels[resolved] = level
+
+        return levels
+
+    def get_state_vectors(self, julian_days) ->tuple:
+        """Gets the state vectors of all the objects relative to their parent, in the ecliptic frame.
+
+        Args:
+            julian_days (array_like): the dates, as Julian days, shape (K,)
+
+        Returns:
+            tuple: (positions in AU, velocities in AU/day), shape (N, K, 3)
+        """
+        days = np.atleast_1d(np.asarray(julian_days, dtype=np.float64))
+        mean_motion = (2 * np.pi / self.get_orbital_period())[:, np.newaxis]
+        perihelion = self._perihelion_julian_days[:, np.newaxis]
+        angles = [np.radians(self._columns[name])[:, np.newaxis] for name in
+                  (envs.O_INCLINATION, envs.O_ASCENDING_NODE, envs.O_ARG_PERIAPSIS)]
+
+        return kepler.state_vectors(self._columns[envs.O_SEMI_MAJOR_AXIS][:, np.newaxis],
+                                    self._columns[envs.O_ECCENTRICITY][:, np.newaxis],
+                                    *angles,
+                                    mean_motion * (days - perihelion),
+                                    mean_motion)
+
+    def get_world_state_vectors(self, julian_days) ->tuple:
+        """Gets the state vectors of all the objects relative to the origin,
+        by adding the state of each parent, one level of the parent tree at a time.
+
+        Args:
+            julian_days (array_like): the dates, as Julian days, shape (K,)
+
+        Returns:
+            tuple: (positions in AU, velocities in AU/day), shape (N, K, 3)
+        """
+        positions, velocities = self.get_state_vectors(julian_days)
+        levels = self.get_levels()
+        for level in range(1, int(levels.max(initial=0)) + 1):
+            children = np.flatnonzero(levels == level)
+            parents = self._parents[children]
+            # parents are one level up, so already in world space
+            positions[children] += positions[parents]
+            velocities[children] += velocities[parents]
+
+        return positions, velocities
+
+    def get_nbytes(self) ->int:
+        """Gets the memory used by the arrays (names excluded)
+
+        Returns:
+            int: the size in bytes
+        """
+        arrays = list(self._columns.values()) + [self._types, self._parents,
+                                                 self._perihelion_julian_days, self._parent_masses]
+        return sum(array.nbytes for array in arrays)
+
+if __name__ == "__main__":
+    pass
@@ -1,24 +1,348 @@
-import os, sqlite3
-from orbit import envs
+import os, sqlite3, threading
+from urllib.request import pathname2url
+import numpy as np
+from collections import namedtuple, OrderedDict
+from itertools import islice
+from orbit import envs, epoch
+
+# table columns, in order, and their field in the rows
+FIELDS = {
+    envs.E_NAME : "name",
+    envs.E_TYPE : "type",
+    envs.E_PARENT : "parent",
+    envs.E_MASS : "mass",
+    envs.E_PERIOD : "rotation_period",
+    envs.E_INCLINATION : "axis_inclination",
+    envs.O_SEMI_MAJOR_AXIS : "semi_major_axis",
+    envs.O_INCLINATION : "inclination",
+    envs.O_ECCENTRICITY : "eccentricity",
+    envs.O_ASCENDING_NODE : "ascending_node",
+    envs.O_ARG_PERIAPSIS : "arg_periapsis",
+    envs.O_PERIHELION_DAY : "perihelion_day",
+    envs.O_SEMI_MINOR_AXIS : "semi_minor_axis",
+    envs.O_PERIOD : "orbital_period",
+    envs.O_CIRCUMFERENCE : "circumference",
+    envs.O_PERIHELION_D : "perihelion_distance",
+    envs.O_PERIHELION_V : "perihelion_velocity",
+    envs.O_APHELION_D : "aphelion_distance",
+    envs.O_APHELION_V : "aphelion_velocity",
+    envs.O_PERIHELION_JD : "perihelion_julian_day",
+}
+COLUMNS = list(FIELDS)
+
+# columns with a B-tree index, for range queries
+INDEXED_COLUMNS = [envs.O_SEMI_MAJOR_AXIS,
+                   envs.O_ECCENTRICITY,
+                   envs.O_INCLINATION,
+                   envs.O_PERIHELION_D,
+                   envs.O_APHELION_D]
+
+# memory mapped bytes of a read-only database
+MMAP_SIZE = 256 * 1024 ** 2
+
+_RECORDS = {}
+
+def record_class(columns:tuple) ->type:
+    """Gets the row type of a set of columns. Rows are tuples, so positional
+    access still works, but fields can be read by name: row.eccentricity,
+    or by envs column name: row.get(envs.O_ECCENTRICITY).
+
+    Args:
+        columns (tuple): the envs column names
+
+    Returns:
+        type: the row type
+    """
+    record = _RECORDS.get(columns)
+    if record is None:
+        base = namedtuple("Row", [FIELDS[column] for column in columns])
+
+        class Row(base):
+            __slots__ = ()
+
+            def get(self, column:str, default=None):
+                # rows of an older schema may miss a column
+                return getattr(self, FIELDS[column], default)
+
+        record = _RECORDS[columns] = Row
+    return record
+
+Row = record_class(tuple(COLUMNS))
+
+_FACTORIES = {}
+
+def row_factory(cursor:sqlite3.Cursor, row:tuple) ->tuple:
+    """sqlite3 row factory: returns table rows as Row, other results as plain tuples.
+    """
+    # the description is the same object for all the rows of a query
+    description = cursor.description
+    key = id(description)
+    cached = _FACTORIES.get(key)
+    if cached is None or cached[0] is not description:
+        columns = tuple(column[0] for column in description)
+        table = all(column in FIELDS for column in columns) and len(set(columns)) == len(columns)
+        record = record_class(columns) if table else None
+        cached = _FACTORIES[key] = (description, record)
+        if len(_FACTORIES) > 64:
+            _FACTORIES.clear()
+            _FACTORIES[key] = cached
+
+    record = cached[1]
+    return record._make(row) if record else row
+
+def changed(columns:list) ->str:
+    """Writes the WHEN condition of an update trigger: true if any of the columns changed.
+
+    Args:
+        columns (list): the envs column names
+
+    Returns:
+        str: the condition
+    """
+    return " OR ".join(f"old.[{column}] IS NOT new.[{column}]" for column in columns)
+
+# Queries, formatted once per database with its table name.
+# The SQL text never changes, so SQLite reuses the compiled statements.
+Q_READ = "read"
+Q_FIND = "find"
+Q_DELETE = "delete"
+Q_UPSERT = "upsert"
+Q_PERIHELION_RANGE = "perihelion_range"
+Q_CHANGES = "changes"
+Q_LAST_CHANGE = "last_change"
+Q_GET_KEYS = "get_keys"
+Q_PUT_KEYS = "put_keys"
+Q_DELETE_KEYS = "delete_keys"
+
+QUERIES = {
+    Q_READ : "SELECT * FROM {table}",
+    Q_FIND : f"SELECT * FROM {{table}} WHERE [{envs.E_NAME}] = ?",
+    Q_DELETE : f"DELETE FROM {{table}} WHERE [{envs.E_NAME}] = ?",
+    Q_UPSERT : f"""
+        INSERT INTO {{table}} ({",".join(f"[{column}]" for column in COLUMNS)})
+        VALUES ({",".join("?" * len(COLUMNS))})
+        ON CONFLICT([{envs.E_NAME}]) DO UPDATE SET
+        {",".join(f"[{column}] = excluded.[{column}]" for column in COLUMNS[1:])}
+        WHERE {" OR ".join(f"[{column}] IS NOT excluded.[{column}]" for column in COLUMNS[1:])}
+        """,
+    Q_PERIHELION_RANGE : f"""
+        SELECT * FROM {{table}} WHERE [{envs.O_PERIHELION_JD}] >= ? AND [{envs.O_PERIHELION_JD}] < ?
+        ORDER BY [{envs.O_PERIHELION_JD}]
+        """,
+    Q_CHANGES : "SELECT seq, name, operation FROM {table}_changes WHERE seq > ? ORDER BY seq",
+    Q_LAST_CHANGE : "SELECT coalesce(max(seq), 0) FROM {table}_changes",
+    Q_GET_KEYS : "SELECT keys FROM {table}_keys WHERE hash = ?",
+    Q_PUT_KEYS : "INSERT OR REPLACE INTO {table}_keys (hash, name, keys) VALUES (?, ?, ?)",
+    Q_DELETE_KEYS : "DELETE FROM {table}_keys WHERE name = ?",
+}
+
+def connect(path:str, read_only:bool=False, check_same_thread:bool=True) ->sqlite3.Connection:
+    """Opens a database file. Read-only, the file is opened as immutable (no lock,
+    no journal: it must not be changed meanwhile) and memory mapped.
+
+    Args:
+        path (str): the database file
+        read_only (bool, optional): Defaults to False.
+        check_same_thread (bool, optional): see sqlite3.connect. Defaults to True.
+
+    Returns:
+        sqlite3.Connection: the connection
+    """
+    if read_only:
+        uri = f"file:{pathname2url(os.path.abspath(path))}?mode=ro&immutable=1"
+        connection = sqlite3.connect(uri, uri=True, check_same_thread=check_same_thread)
+        connection.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+    else:
+        connection = sqlite3.connect(path, check_same_thread=check_same_thread)
+    connection.row_factory = row_factory
+    return connection
+
+class ConnectionPool():
+    """This class gives each thread its own connection to a database file.
+    The database is switched to WAL journaling, so readers are not blocked by a writer.
+
+        Args:
+            path (str): the database file
+            read_only (bool, optional): Opens the file read-only, see connect. Defaults to False.
+        """
+    def __init__(self, path:str, read_only:bool=False) -> None:
+        self._path = path
+        self._read_only = read_only
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+
+    def get(self) ->sqlite3.Connection:
+        """Gets the connection of the current thread, opens it if needed.
+
+        Returns:
+            sqlite3.Connection: the connection
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # only used by this thread, but closed by the pool
+            connection = connect(self._path, self._read_only, check_same_thread=False)
+            if not self._read_only:
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.cursor = connection.cursor()
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def cursor(self) ->sqlite3.Cursor:
+        """Gets the cursor of the current thread.
+
+        Returns:
+            sqlite3.Cursor: the cursor
+        """
+        self.get()
+        return self._local.cursor
+
+    def close(self) ->None:
+        """Closes the connections of all the threads.
+        """
+        with self._lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections = []
+        self._local = threading.local()
+
+class RowCache():
+    """This class keeps the latest rows read by name, and forgets
+    the least recently used ones beyond its size.
+
+        Args:
+            size (int): the maximum number of names kept
+        """
+    def __init__(self, size:int) -> None:
+        self._size = size
+        self._rows = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        # bumped by invalidate (by name) and clear (all), so a read that
+        # started before a write does not cache the old rows
+        self._generation = 0
+        self._generations = {}
+
+    def get(self, name:str):
+        """Gets the cached rows of a name.
+
+        Returns:
+            list | None: the rows, None if not cached
+        """
+        with self._lock:
+            rows = self._rows.get(name)
+            if rows is None:
+                self._misses += 1
+                return None
+            self._rows.move_to_end(name)
+            self._hits += 1
+            return list(rows)
+
+    def get_generation(self, name:str) ->tuple:
+        """Gets the version of a name, to give to put after reading its rows.
+        """
+        with self._lock:
+            return (self._generation, self._generations.get(name, 0))
+
+    def put(self, name:str, rows:list, generation:tuple=None) ->None:
+        """Caches the rows of a name, unless it was invalidated since generation.
+
+        Args:
+            name (str): the name
+            rows (list): the rows
+            generation (tuple, optional): from get_generation, before the read. Defaults to None.
+        """
+        if self._size <= 0:
+            return
+        with self._lock:
+            if generation is not None and generation != (self._generation, self._generations.get(name, 0)):
+                return
+            self._rows[name] = tuple(rows)
+            self._rows.move_to_end(name)
+            if len(self._rows) > self._size:
+                self._rows.popitem(last=False)
+
+    def invalidate(self, name:str) ->None:
+        with self._lock:
+            self._generations[name] = self._generations.get(name, 0) + 1
+            self._rows.pop(name, None)
+
+    def clear(self) ->None:
+        with self._lock:
+            self._generation += 1
+            self._generations.clear()
+            self._rows.clear()
+
+    def get_stats(self) ->dict:
+        """Gets the hit and miss counters
+
+        Returns:
+            dict: hits, misses and the number of cached names
+        """
+        with self._lock:
+            return {"hits" : self._hits, "misses" : self._misses, "size" : len(self._rows)}
 
 class Database():
-    def __init__(self, project_path:str) -> None:
+    """This class stores the objects of a project in a SQLite database.
+
+        Args:
+            project_path (str): the project directory
+            pool (bool, optional): Gives each thread its own connection, in WAL mode,
+                so the database can be read while another thread writes. Defaults to False.
+            cache_size (int, optional): nb of names kept in the find_object cache. Defaults to 1024.
+            read_only (bool, optional): Opens an existing database read-only, memory mapped
+                and without any schema update, e.g. for the examples. Defaults to False.
+        """
+    def __init__(self, project_path:str, pool:bool=False, cache_size:int=1024,
+                 read_only:bool=False) -> None:
         self._path = project_path
+        self._read_only = read_only
         self._name = os.path.basename(self._path)
+        self._queries = {name : sql.format(table=self._name) for name, sql in QUERIES.items()}
+        self._cache = RowCache(cache_size)
+
+        self._pool = None
+        self._connection = None
+        if pool:
+            self._pool = ConnectionPool(self.get_path(), read_only)
+        else:
+            self._connection = self.connect()
+            self._connection_cursor = self._connection.cursor()
+
+        if read_only:
+            self.detect()
+        else:
+            self.create()
 
-        self._db = self.connect()
-        self._cursor = self._db.cursor()
+    @property
+    def _db(self) ->sqlite3.Connection:
+        if self._pool:
+            return self._pool.get()
+        return self._connection
 
-        self.create()
+    @property
+    def _cursor(self) ->sqlite3.Cursor:
+        if self._pool:
+            return self._pool.cursor()
+        return self._connection_cursor
+
+    def get_path(self) ->str:
+        return os.path.join(self._path, f"{self._name}_database.db")
+
+    def is_read_only(self) ->bool:
+        return self._read_only
+
+    def _check_writable(self) ->None:
+        if self._read_only:
+            raise RuntimeError(f"The project '{self._name}' is read-only.")
 
     def connect(self):
-        return sqlite3.connect(os.path.join(self._path, f"{self._name}_database.db"))
+        return connect(self.get_path(), self._read_only)
 
-    def _row_exists(self, name:str) ->bool:
-        for file in self.read():
-            if file[0] == name:
-                return True
-            
     def create(self) ->None:
         self._cursor.execute(f"""
                 CREATE TABLE IF NOT EXISTS {self._name}
@@ -41,77 +365,584 @@ class Database():
                     [{envs.O_PERIHELION_D}] REAL,
                     [{envs.O_PERIHELION_V}] REAL,
                     [{envs.O_APHELION_D}] REAL,
-                    [{envs.O_APHELION_V}] REAL  
+                    [{envs.O_APHELION_V}] REAL,
+                    [{envs.O_PERIHELION_JD}] REAL
                 )
                 """)
+        self.migrate()
 
-    def insert_object(self, data:dict) ->None:
-        object_name = data[envs.E_NAME]
-        if self._row_exists(object_name):
-            self.delete_object(object_name)
+    def detect(self) ->None:
+        """Finds the optional tables of the schema, without creating them.
+        """
+        self._cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        tables = {row[0] for row in self._cursor.fetchall()}
+        if self._name not in tables:
+            raise RuntimeError(f"No table '{self._name}' in {self.get_path()}")
+        self._rtree = f"{self._name}_rtree" in tables
+        self._name_index = self.create_name_index() if f"{self._name}_names" in tables else None
+        self._change_log = f"{self._name}_changes" in tables
+        self._keys_cache = f"{self._name}_keys" in tables
+        self._cursor.execute(f"PRAGMA table_info({self._name})")
+        self._julian_day_column = envs.O_PERIHELION_JD in [column[1] for column in self._cursor.fetchall()]
+
+    @staticmethod
+    def _is_date(date) ->bool:
+        try:
+            epoch.parse_date(date)
+        except RuntimeError:
+            return False
+        return True
+
+    def _index_exists(self, index:str) ->bool:
+        self._cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (index,))
+        return self._cursor.fetchone() is not None
+
+    def migrate(self) ->None:
+        """Updates the table of an older project to the current schema.
+        """
+        # names become unique: for duplicates, the last inserted row is kept
+        index = f"{self._name}_name_index"
+        if not self._index_exists(index):
+            self._cursor.execute(f"""
+                    DELETE FROM {self._name} WHERE rowid NOT IN
+                    (SELECT MAX(rowid) FROM {self._name} GROUP BY [{envs.E_NAME}])
+                    """)
+            self._cursor.execute(f"CREATE UNIQUE INDEX {index} ON {self._name} ([{envs.E_NAME}])")
+
+        # perihelion dates are also stored as Julian days
+        self._cursor.execute(f"PRAGMA table_info({self._name})")
+        if envs.O_PERIHELION_JD not in [column[1] for column in self._cursor.fetchall()]:
+            self._cursor.execute(f"ALTER TABLE {self._name} ADD COLUMN [{envs.O_PERIHELION_JD}] REAL")
+            self._cursor.execute(f"SELECT [{envs.E_NAME}], [{envs.O_PERIHELION_DAY}] FROM {self._name}")
+            rows = [row for row in self._cursor.fetchall() if row[1]]
+            try:
+                dates = epoch.parse_dates(row[1] for row in rows)
+            except RuntimeError:
+                # malformed dates keep a NULL Julian day, the project still opens
+                rows = [row for row in rows if self._is_date(row[1])]
+                dates = epoch.parse_dates(row[1] for row in rows)
+            if rows:
+                julian_days = epoch.julian_day(dates[:, 0], dates[:, 1], dates[:, 2]).tolist()
+                self._cursor.executemany(f"UPDATE {self._name} SET [{envs.O_PERIHELION_JD}] = ? WHERE [{envs.E_NAME}] = ?",
+                                         zip(julian_days, [row[0] for row in rows]))
 
+        index = f"{self._name}_perihelion_index"
+        if not self._index_exists(index):
+            self._cursor.execute(f"CREATE INDEX {index} ON {self._name} ([{envs.O_PERIHELION_JD}])")
+
+        for column in INDEXED_COLUMNS:
+            self._cursor.execute(f"CREATE INDEX IF NOT EXISTS {self._name}_{FIELDS[column]}_index ON {self._name} ([{column}])")
+
+        self._rtree = self.create_rtree()
+        self._name_index = self.create_name_index()
+        self.create_change_log()
+        self.create_keys_cache()
+        self._change_log = self._keys_cache = self._julian_day_column = True
+        self._db.commit()
+
+    def create_keys_cache(self) ->None:
+        """Creates the table keeping the computed keyframes of the orbits, by hash
+        of their inputs. An object keeps only its latest keys, removed with it.
+        """
+        keys = f"{self._name}_keys"
         self._cursor.execute(f"""
-                INSERT INTO {self._name}
+                CREATE TABLE IF NOT EXISTS {keys}
                 (
-                    [{envs.E_NAME}],
-                    [{envs.E_TYPE}],
-                    [{envs.E_PARENT}],
-                    [{envs.E_MASS}],
-                    [{envs.E_PERIOD}],
-                    [{envs.E_INCLINATION}],
-                    [{envs.O_SEMI_MAJOR_AXIS}],
-                    [{envs.O_INCLINATION}],
-                    [{envs.O_ECCENTRICITY}],
-                    [{envs.O_ASCENDING_NODE}],
-                    [{envs.O_ARG_PERIAPSIS}],
-                    [{envs.O_PERIHELION_DAY}],
-                    [{envs.O_SEMI_MINOR_AXIS}],
-                    [{envs.O_PERIOD}],
-                    [{envs.O_CIRCUMFERENCE}],
-                    [{envs.O_PERIHELION_D}],
-                    [{envs.O_PERIHELION_V}],
-                    [{envs.O_APHELION_D}],
-                    [{envs.O_APHELION_V}]
+                    hash TEXT PRIMARY KEY,
+                    name TEXT,
+                    keys BLOB
                 )
+                """)
+        self._cursor.execute(f"CREATE INDEX IF NOT EXISTS {keys}_name_index ON {keys} (name)")
+        self._cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {keys}_delete AFTER DELETE ON {self._name} BEGIN
+                DELETE FROM {keys} WHERE name = old.[{envs.E_NAME}]; END
+                """)
 
-                VALUES
-                (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
-                """, (object_name,
-                      data[envs.E_TYPE],
-                      data[envs.E_PARENT],
-                      data[envs.E_MASS],
-                      data.get(envs.E_PERIOD,0),
-                      data.get(envs.E_INCLINATION,0),
-                      data.get(envs.O_SEMI_MAJOR_AXIS,0),
-                      data.get(envs.O_INCLINATION,0),
-                      data.get(envs.O_ECCENTRICITY,0),
-                      data.get(envs.O_ASCENDING_NODE,0),
-                      data.get(envs.O_ARG_PERIAPSIS,0),
-                      str(data.get(envs.O_PERIHELION_DAY,"")),
-                      data.get(envs.O_SEMI_MINOR_AXIS,0),
-                      data.get(envs.O_PERIOD,0),
-                      data.get(envs.O_CIRCUMFERENCE,0),
-                      data.get(envs.O_PERIHELION_D,0),
-                      data.get(envs.O_PERIHELION_V,0),
-                      data.get(envs.O_APHELION_D,0),
-                      data.get(envs.O_APHELION_V,0),
-                      )
+    def create_change_log(self) ->None:
+        """Creates the table logging every insert, update and delete with
+        an increasing sequence number. Triggers fill it.
+        """
+        changes = f"{self._name}_changes"
+        self._cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS {changes}
+                (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT,
+                    operation TEXT
                 )
+                """)
+        for event, operation, row in (("INSERT", envs.C_INSERT, "new"),
+                                      ("DELETE", envs.C_DELETE, "old")):
+            self._cursor.execute(f"""
+                    CREATE TRIGGER IF NOT EXISTS {changes}_{operation} AFTER {event} ON {self._name} BEGIN
+                    INSERT INTO {changes} (name, operation) VALUES ({row}.[{envs.E_NAME}], '{operation}'); END
+                    """)
+        # updates writing the same values are not logged.
+        # Recreated on each opening, the first version had no WHEN clause
+        self._cursor.execute(f"DROP TRIGGER IF EXISTS {changes}_{envs.C_UPDATE}")
+        self._cursor.execute(f"""
+                CREATE TRIGGER {changes}_{envs.C_UPDATE} AFTER UPDATE ON {self._name} WHEN {changed(COLUMNS)} BEGIN
+                INSERT INTO {changes} (name, operation) VALUES (new.[{envs.E_NAME}], '{envs.C_UPDATE}'); END
+                """)
+
+    def create_name_index(self) ->str:
+        """Creates the full-text index of the names, with the trigram tokenizer (substrings)
+        or else the default one (word prefixes). Triggers keep it in sync with the table.
+
+        Returns:
+            str: the tokenizer, None if SQLite was built without FTS5
+        """
+        names = f"{self._name}_names"
+        self._cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (names,))
+        row = self._cursor.fetchone()
+        if row:
+            return "trigram" if "trigram" in row[0] else "unicode61"
+
+        for tokenizer in ("trigram", "unicode61"):
+            try:
+                self._cursor.execute(f"""
+                        CREATE VIRTUAL TABLE {names} USING fts5
+                        ("{envs.E_NAME}", content='{self._name}', content_rowid='rowid', tokenize='{tokenizer}')
+                        """)
+                break
+            except sqlite3.OperationalError:
+                tokenizer = None
+        if tokenizer is None:
+            return None
+
+        self._cursor.execute(f"""
+                CREATE TRIGGER {names}_insert AFTER INSERT ON {self._name} BEGIN
+                INSERT INTO {names} (rowid, [{envs.E_NAME}]) VALUES (new.rowid, new.[{envs.E_NAME}]); END
+                """)
+        self._cursor.execute(f"""
+                CREATE TRIGGER {names}_update AFTER UPDATE OF [{envs.E_NAME}] ON {self._name} BEGIN
+                INSERT INTO {names} ({names}, rowid, [{envs.E_NAME}]) VALUES ('delete', old.rowid, old.[{envs.E_NAME}]);
+                INSERT INTO {names} (rowid, [{envs.E_NAME}]) VALUES (new.rowid, new.[{envs.E_NAME}]); END
+                """)
+        self._cursor.execute(f"""
+                CREATE TRIGGER {names}_delete AFTER DELETE ON {self._name} BEGIN
+                INSERT INTO {names} ({names}, rowid, [{envs.E_NAME}]) VALUES ('delete', old.rowid, old.[{envs.E_NAME}]); END
+                """)
+        # existing rows
+        self._cursor.execute(f"INSERT INTO {names} ({names}) VALUES ('rebuild')")
+        return tokenizer
+
+    def create_rtree(self) ->bool:
+        """Creates the R*Tree indexing the orbits by the shell between their perihelion
+        and aphelion distances, and by inclination. Triggers keep it in sync with the table.
+
+        Returns:
+            bool: False if SQLite was built without the R*Tree module
+        """
+        rtree = f"{self._name}_rtree"
+        self._cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (rtree,))
+        exists = self._cursor.fetchone() is not None
+        if not exists:
+            try:
+                self._cursor.execute(f"CREATE VIRTUAL TABLE {rtree} USING rtree(id, min_distance, max_distance, min_inclination, max_inclination)")
+            except sqlite3.OperationalError:
+                return False
+
+        # hyperbolic orbits have a negative aphelion distance, bounds must stay ordered
+        values = f"""
+                min(coalesce(new.[{envs.O_PERIHELION_D}], 0), coalesce(new.[{envs.O_APHELION_D}], 0)),
+                max(coalesce(new.[{envs.O_PERIHELION_D}], 0), coalesce(new.[{envs.O_APHELION_D}], 0)),
+                coalesce(new.[{envs.O_INCLINATION}], 0),
+                coalesce(new.[{envs.O_INCLINATION}], 0)
+                """
+        # only reindexed when the box changes.
+        # Recreated on each opening, the first version had no WHEN clause
+        box = changed([envs.O_PERIHELION_D, envs.O_APHELION_D, envs.O_INCLINATION])
+        self._cursor.execute(f"DROP TRIGGER IF EXISTS {rtree}_update")
+        self._cursor.execute(f"""
+                CREATE TRIGGER {rtree}_update AFTER UPDATE ON {self._name} WHEN {box} BEGIN
+                DELETE FROM {rtree} WHERE id = old.rowid;
+                INSERT INTO {rtree} VALUES (new.rowid, {values}); END
+                """)
+        if exists:
+            return True
 
+        self._cursor.execute(f"""
+                CREATE TRIGGER {rtree}_insert AFTER INSERT ON {self._name} BEGIN
+                INSERT INTO {rtree} VALUES (new.rowid, {values}); END
+                """)
+        self._cursor.execute(f"""
+                CREATE TRIGGER {rtree}_delete AFTER DELETE ON {self._name} BEGIN
+                DELETE FROM {rtree} WHERE id = old.rowid; END
+                """)
+        # existing rows
+        self._cursor.execute(f"""
+                INSERT INTO {rtree} SELECT rowid, {values.replace("new.", "")} FROM {self._name}
+                """)
+        return True
+
+    def insert_object(self, data:dict) ->None:
+        """Inserts an object, or updates it if its name already exists.
+
+        Args:
+            data (dict): the physical and orbital characteristics, by column name
+        """
+        self._check_writable()
+        self._cursor.execute(self._queries[Q_UPSERT], self._values(data))
         self._db.commit()
+        self._cache.invalidate(data[envs.E_NAME])
+
+    def insert_objects(self, objects, batch_size:int=1000) ->int:
+        """Inserts or updates many objects in a single transaction.
+        Rows are sent by batches, so the iterable is never fully loaded in memory.
+
+        Args:
+            objects (iterable[dict]): the physical and orbital characteristics, by column name
+            batch_size (int, optional): nb of rows per executemany. Defaults to 1000.
+
+        Returns:
+            int: the number of objects inserted
+        """
+        self._check_writable()
+        sql = self._queries[Q_UPSERT]
+        rows = (self._values(data) for data in objects)
+        count = 0
+        # commits once at the end, or rolls back everything on error
+        with self._db:
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+                self._cursor.executemany(sql, batch)
+                count += len(batch)
+        self._cache.clear()
+
+        return count
+
+    def _values(self, data:dict) ->tuple:
+        return (data[envs.E_NAME],
+                data[envs.E_TYPE],
+                data[envs.E_PARENT],
+                data[envs.E_MASS],
+                data.get(envs.E_PERIOD,0),
+                data.get(envs.E_INCLINATION,0),
+                data.get(envs.O_SEMI_MAJOR_AXIS,0),
+                data.get(envs.O_INCLINATION,0),
+                data.get(envs.O_ECCENTRICITY,0),
+                data.get(envs.O_ASCENDING_NODE,0),
+                data.get(envs.O_ARG_PERIAPSIS,0),
+                str(data.get(envs.O_PERIHELION_DAY,"")),
+                data.get(envs.O_SEMI_MINOR_AXIS,0),
+                data.get(envs.O_PERIOD,0),
+                data.get(envs.O_CIRCUMFERENCE,0),
+                data.get(envs.O_PERIHELION_D,0),
+                data.get(envs.O_PERIHELION_V,0),
+                data.get(envs.O_APHELION_D,0),
+                data.get(envs.O_APHELION_V,0),
+                self._julian_day(data),
+                )
+
+    def _julian_day(self, data:dict) ->float:
+        if data.get(envs.O_PERIHELION_JD) is not None:
+            return data[envs.O_PERIHELION_JD]
+        if not data.get(envs.O_PERIHELION_DAY):
+            return None
+        date = epoch.parse_date(data[envs.O_PERIHELION_DAY])
+        return float(epoch.julian_day(int(date[0]), int(date[1]), int(date[2])))
 
     def read(self):
-        self._cursor.execute(f"SELECT * FROM {self._name}")
+        self._cursor.execute(self._queries[Q_READ])
         return self._cursor.fetchall()
+
+    def _select_sql(self, columns:list=None, where:dict=None) ->str:
+        """Writes a SELECT on the table. Column names are checked, values are left as parameters.
+
+        Args:
+            columns (list, optional): the columns to read. Defaults to all.
+            where (dict, optional): by column, the value to match. Defaults to None.
+
+        Returns:
+            str: the query
+        """
+        for column in (columns or []) + list(where or {}):
+            if column not in COLUMNS:
+                raise RuntimeError(f"Unknown column '{column}'")
+
+        projection = ",".join(f"[{column}]" for column in columns) if columns else "*"
+        sql = f"SELECT {projection} FROM {self._name}"
+        if where:
+            sql += " WHERE " + " AND ".join(f"[{column}] = ?" for column in where)
+        return sql
+
+    def iter_rows(self, columns:list=None, where:dict=None, batch_size:int=1000):
+        """Reads the table row by row, fetching batches from SQLite.
+
+        Args:
+            columns (list, optional): the columns to read. Defaults to all.
+            where (dict, optional): by column, the value to match. Defaults to None.
+            batch_size (int, optional): nb of rows fetched at once. Defaults to 1000.
+
+        Yields:
+            tuple: the rows
+        """
+        # own cursor, other queries may run while iterating
+        cursor = self._db.cursor()
+        try:
+            cursor.execute(self._select_sql(columns, where), tuple((where or {}).values()))
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            cursor.close()
+
+    def read_page(self, after:str=None, limit:int=100, columns:list=None, where:dict=None) ->list:
+        """Reads the rows sorted by name, one page at a time (keyset pagination on the name index).
+
+        Args:
+            after (str, optional): the last name of the previous page. Defaults to the first page.
+            limit (int, optional): nb of rows per page. Defaults to 100.
+            columns (list, optional): the columns to read, the name is always first. Defaults to all.
+            where (dict, optional): by column, the value to match. Defaults to None.
+
+        Returns:
+            list: the rows
+        """
+        if columns:
+            columns = [envs.E_NAME] + [column for column in columns if column != envs.E_NAME]
+        where = dict(where or {})
+        sql = self._select_sql(columns, where)
+        values = list(where.values())
+        if after is not None:
+            sql += " AND " if where else " WHERE "
+            sql += f"[{envs.E_NAME}] > ?"
+            values.append(after)
+        sql += f" ORDER BY [{envs.E_NAME}] LIMIT ?"
+        values.append(limit)
+
+        cursor = self._db.cursor()
+        try:
+            return cursor.execute(sql, values).fetchall()
+        finally:
+            cursor.close()
     
     def find_object(self, name:str):
-        self._cursor.execute(f"SELECT * FROM {self._name} WHERE [{envs.E_NAME}] = '{name}'")
+        rows = self._cache.get(name)
+        if rows is not None:
+            return rows
+
+        generation = self._cache.get_generation(name)
+        self._cursor.execute(self._queries[Q_FIND], (name,))
+        rows = self._cursor.fetchall()
+        self._cache.put(name, rows, generation)
+        return rows
+
+    def search_names(self, text:str, limit:int=20) ->list:
+        """Finds the names containing a text (the start of a word without the trigram
+        tokenizer), names starting with it first, then by relevance. Case insensitive.
+        Texts shorter than 3 characters only match the start of the names.
+
+        Args:
+            text (str): the text to search
+            limit (int, optional): nb of names returned. Defaults to 20.
+
+        Returns:
+            list[str]: the names
+        """
+        text = text.strip()
+        if not text:
+            return []
+        pattern = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        query = '"' + text.replace('"', '""') + '"'
+        if self._name_index == "unicode61":
+            query += "*"
+
+        if self._name_index and (self._name_index != "trigram" or len(text) >= 3):
+            names = f"{self._name}_names"
+            self._cursor.execute(f"""
+                    SELECT [{envs.E_NAME}] FROM {names} WHERE {names} MATCH ?
+                    ORDER BY [{envs.E_NAME}] LIKE ? ESCAPE '\\' DESC, rank LIMIT ?
+                    """, (query, pattern, limit))
+        else:
+            # prefix only, with the unique index of the names
+            self._cursor.execute(f"""
+                    SELECT [{envs.E_NAME}] FROM {self._name} WHERE [{envs.E_NAME}] LIKE ? ESCAPE '\\'
+                    ORDER BY [{envs.E_NAME}] LIMIT ?
+                    """, (pattern, limit))
+        return [row[0] for row in self._cursor.fetchall()]
+
+    def get_keys(self, key_hash:str) ->dict:
+        """Gets cached keyframes.
+
+        Args:
+            key_hash (str): the hash of the inputs, see ObjectInOrbit.get_keys_hash
+
+        Returns:
+            dict: the values by time, None if not cached
+        """
+        if not self._keys_cache:
+            return None
+        self._cursor.execute(self._queries[Q_GET_KEYS], (key_hash,))
+        row = self._cursor.fetchone()
+        if row is None:
+            return None
+        times, values = np.frombuffer(row[0], dtype=np.float64).reshape(2, -1)
+        return dict(zip(times.tolist(), values.tolist()))
+
+    def put_keys(self, entries:list) ->None:
+        """Caches the keyframes of objects, in place of their previous ones,
+        in a single transaction.
+
+        Args:
+            entries (list[tuple]): (hash of the inputs, see ObjectInOrbit.get_keys_hash,
+                name of the object, values by time)
+        """
+        entries = [(key_hash, name, np.array([list(keys), list(keys.values())], dtype=np.float64).tobytes())
+                   for key_hash, name, keys in entries]
+        if not entries:
+            return
+        self._check_writable()
+        with self._db:
+            self._cursor.executemany(self._queries[Q_DELETE_KEYS], [(name,) for _, name, _ in entries])
+            self._cursor.executemany(self._queries[Q_PUT_KEYS], entries)
+
+    def changes_since(self, seq:int=0) ->list:
+        """Gets the changes made after a sequence number.
+
+        Args:
+            seq (int, optional): the last sequence number already known. Defaults to 0.
+
+        Returns:
+            list[tuple]: (seq, name, operation), in order
+        """
+        if not self._change_log:
+            return []
+        self._cursor.execute(self._queries[Q_CHANGES], (seq,))
         return self._cursor.fetchall()
+
+    def get_last_change(self) ->int:
+        """Gets the sequence number of the latest change, 0 if none.
+        """
+        if not self._change_log:
+            return 0
+        self._cursor.execute(self._queries[Q_LAST_CHANGE])
+        return self._cursor.fetchone()[0]
+
+    def get_cache_stats(self) ->dict:
+        """Gets the hit and miss counters of the find_object cache
+
+        Returns:
+            dict: hits, misses and the number of cached names
+        """
+        return self._cache.get_stats()
     
+    def find_by_perihelion(self, start:float, end:float) ->list:
+        """Finds the objects with a perihelion date in a range, using the Julian day index.
+
+        Args:
+            start (float): the first Julian day, included
+            end (float): the last Julian day, excluded
+
+        Returns:
+            list: the rows, sorted by perihelion date
+        """
+        if not self._julian_day_column:
+            return self._find_by_perihelion_dates(start, end)
+        self._cursor.execute(self._queries[Q_PERIHELION_RANGE], (start, end))
+        return self._cursor.fetchall()
+
+    def _find_by_perihelion_dates(self, start:float, end:float) ->list:
+        """find_by_perihelion for an older schema opened read-only, without the Julian
+        day column: the stored dates are parsed, malformed ones are skipped.
+        """
+        rows = [row for row in self.read() if self._is_date(row.get(envs.O_PERIHELION_DAY))]
+        dates = epoch.parse_dates(row.get(envs.O_PERIHELION_DAY) for row in rows)
+        julian_days = epoch.julian_day(dates[:, 0], dates[:, 1], dates[:, 2]).tolist()
+        found = sorted((julian_day, i) for i, julian_day in enumerate(julian_days) if start <= julian_day < end)
+        return [rows[i] for _, i in found]
+
+    def find_in_ranges(self, ranges:dict) ->list:
+        """Finds the objects whose characteristics are all in the given ranges.
+        Indexed columns (INDEXED_COLUMNS) are searched without scanning the table.
+
+        Args:
+            ranges (dict): by column, (min, max) bounds, both included. None for no bound.
+                e.g. {envs.O_SEMI_MAJOR_AXIS : (2.1, 3.3), envs.O_ECCENTRICITY : (None, 0.2)}
+
+        Returns:
+            list: the rows
+        """
+        conditions, values = [], []
+        for column, (low, high) in ranges.items():
+            if column not in COLUMNS:
+                raise RuntimeError(f"Unknown column '{column}'")
+            if low is not None:
+                conditions.append(f"[{column}] >= ?")
+                values.append(low)
+            if high is not None:
+                conditions.append(f"[{column}] <= ?")
+                values.append(high)
+
+        sql = self._queries[Q_READ]
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        self._cursor.execute(sql, values)
+        return self._cursor.fetchall()
+
+    def find_overlapping(self, min_distance:float, max_distance:float=None,
+                         min_inclination:float=None, max_inclination:float=None) ->list:
+        """Finds the orbits whose shell, between perihelion and aphelion distances,
+        overlaps a range of distances: find_overlapping(1) gives the orbits crossing 1 AU.
+        Uses the R*Tree, then checks the exact values (the R*Tree stores 32 bits floats).
+
+        Args:
+            min_distance (float): in AU
+            max_distance (float, optional): in AU. Defaults to min_distance.
+            min_inclination (float, optional): in deg. Defaults to None.
+            max_inclination (float, optional): in deg. Defaults to None.
+
+        Returns:
+            list: the rows
+        """
+        if max_distance is None:
+            max_distance = min_distance
+        low = f"min([{envs.O_PERIHELION_D}], [{envs.O_APHELION_D}])"
+        high = f"max([{envs.O_PERIHELION_D}], [{envs.O_APHELION_D}])"
+        conditions = [f"{low} <= ?", f"{high} >= ?"]
+        values = [max_distance, min_distance]
+        if min_inclination is not None:
+            conditions.append(f"[{envs.O_INCLINATION}] >= ?")
+            values.append(min_inclination)
+        if max_inclination is not None:
+            conditions.append(f"[{envs.O_INCLINATION}] <= ?")
+            values.append(max_inclination)
+
+        if self._rtree:
+            rtree = f"{self._name}_rtree"
+            box = [f"{rtree}.min_distance <= ?", f"{rtree}.max_distance >= ?"]
+            box_values = [max_distance, min_distance]
+            if min_inclination is not None:
+                box.append(f"{rtree}.max_inclination >= ?")
+                box_values.append(min_inclination)
+            if max_inclination is not None:
+                box.append(f"{rtree}.min_inclination <= ?")
+                box_values.append(max_inclination)
+            sql = f"""
+                SELECT {self._name}.* FROM {rtree} JOIN {self._name} ON {self._name}.rowid = {rtree}.id
+                WHERE {" AND ".join(box + conditions)}
+                """
+            values = box_values + values
+        else:
+            sql = self._queries[Q_READ] + " WHERE " + " AND ".join(conditions)
+
+        self._cursor.execute(sql, values)
+        return self._cursor.fetchall()
+
     def delete_object(self, name:str):
-        sql = f"DELETE FROM {self._name} WHERE [{envs.E_NAME}] = '{name}'"
-        self._cursor.execute(sql)
+        self._check_writable()
+        self._cursor.execute(self._queries[Q_DELETE], (name,))
         self._db.commit()
+        self._cache.invalidate(name)
 
     def close(self) ->None:
-        self._db.close()
\ No newline at end of file
+        if self._pool:
+            self._pool.close()
+        else:
+            self._connection.close()
\ No newline at end of file
@@ -4,6 +4,8 @@ G = 6.67430e-11 # Newton's gravitational constant
 
 SOLAR_MASS = 1.989e30 # Solar mass in kilograms
 
+J2000 = 2451545.0 # Julian day of 2000-01-01 12:00:00 UTC
+
 # Main names
 E_NAME = "Name"
 E_TYPE = "Type"
@@ -17,6 +19,7 @@ O_ECCENTRICITY = "Eccentricity"
 O_ASCENDING_NODE = "Ascending Node (°)"
 O_ARG_PERIAPSIS = "Periapsis Argument (°)"
 O_PERIHELION_DAY = "Perihelion or Perigee Date"
+O_PERIHELION_JD = "Perihelion or Perigee Julian Day"
 
 # Additional names
 O_SEMI_MINOR_AXIS = "Semi Minor Axis (AU)"
@@ -81,4 +84,9 @@ COLORS = {
 # Parents
 ORIGIN = "Origin"
 
+# Change log operations
+C_INSERT = "insert"
+C_UPDATE = "update"
+C_DELETE = "delete"
+
 ME = "https://www.linkedin.com/in/tristan-giandoriggio/"
\ No newline at end of file
@@ -0,0 +1,115 @@
+import numpy as np
+from orbit import envs
+
+def _div(x:int, y:int) ->int:
+    # C-like division on Python ints
+    quotient = abs(x) // y
+    return quotient if x >= 0 else -quotient
+
+def _julian_day_number(year:int, month:int, day:int) ->int:
+    # scalar version of julian_day_number, NumPy is slower on single dates
+    a = _div(month - 14, 12)
+    return (day - 32075
+            + _div(1461 * (year + 4800 + a), 4)
+            + _div(367 * (month - 2 - 12 * a), 12)
+            - _div(3 * _div(year + 4900 + a, 100), 4))
+
+def julian_day_number(year, month, day) ->np.ndarray:
+    """Gets the Julian day number (the Julian day at noon) of Gregorian dates,
+    with integer arithmetic only (Fliegel & Van Flandern).
+
+    Args:
+        year (array_like): the years
+        month (array_like): the months, 1 to 12
+        day (array_like): the days of the month
+
+    Returns:
+        np.ndarray | int: the Julian day numbers, as integers. An int for int arguments
+    """
+    if type(year) is int and type(month) is int and type(day) is int:
+        return _julian_day_number(year, month, day)
+    year = np.asarray(year, dtype=np.int64)
+    month = np.asarray(month, dtype=np.int64)
+    day = np.asarray(day, dtype=np.int64)
+    # C-like division, as in the original algorithm
+    def div(x, y):
+        return np.sign(x) * (np.abs(x) // y)
+    # january and february count as months 13 and 14 of the previous year
+    a = div(month - 14, 12)
+    return (day - 32075
+            + div(1461 * (year + 4800 + a), 4)
+            + div(367 * (month - 2 - 12 * a), 12)
+            - div(3 * div(year + 4900 + a, 100), 4))
+
+def julian_day(year, month, day) ->np.ndarray:
+    """Gets the Julian day at 00:00 UTC of Gregorian dates.
+
+    Args:
+        year (array_like): the years
+        month (array_like): the months, 1 to 12
+        day (array_like): the days of the month
+
+    Returns:
+        np.ndarray | float: the Julian days. A float for int arguments
+    """
+    return julian_day_number(year, month, day) - 0.5
+
+def days_from_j2000(year, month, day) ->np.ndarray:
+    """Gets the number of whole days from J2000 (2000-01-01 12:00 UTC)
+    to Gregorian dates at 00:00, rounded down like a datetime difference.
+
+    Args:
+        year (array_like): the years
+        month (array_like): the months, 1 to 12
+        day (array_like): the days of the month
+
+    Returns:
+        np.ndarray | int: the days, as integers
+    """
+    return julian_day_number(year, month, day) - (int(envs.J2000) + 1)
+
+def parse_dates(dates) ->np.ndarray:
+    """Parses stored dates like "[2023, 1, 4]" (or lists) in one pass.
+
+    Args:
+        dates (list): the dates
+
+    Returns:
+        np.ndarray: the dates, shape (N, 3), as [year, month, day] integers
+    """
+    dates = list(dates)
+    if not dates:
+        return np.empty((0, 3), dtype=np.int64)
+    rows = [str(date).strip("[] ") for date in dates]
+    # a row without 3 values would shift all the following ones
+    for date, row in zip(dates, rows):
+        if row.count(",") != 2:
+            raise RuntimeError(f"Dates must be written as [year, month, day], not {date}.")
+    text = ",".join(rows)
+    try:
+        values = np.array(text.split(","), dtype=np.float64).astype(np.int64)
+        return values.reshape(len(dates), 3)
+    except ValueError:
+        raise RuntimeError("Dates must be written as [year, month, day].")
+
+def parse_date(date) ->list:
+    """Parses one stored date like "[2023, 1, 4]".
+
+    Args:
+        date (str | list): the date
+
+    Returns:
+        list[int]: [year, month, day]
+    """
+    if isinstance(date, list):
+        return date
+    values = str(date).strip("[] ").split(",")
+    try:
+        if len(values) != 3:
+            raise ValueError
+        return [int(float(value)) for value in values]
+    except ValueError:
+        raise RuntimeError(f"Dates must be written as [year, month, day], not {date}.")
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,338 @@
+import os
+import numpy as np
+
+TOLERANCE = 1e-12 # rad
+MAX_ITERATIONS = 50
+# change it when the solvers give other results, to invalidate cached data
+VERSION = 1
+
+# Solver modes
+S_NEWTON = "newton"
+S_TABLE = "table"
+
+SOLVER = S_NEWTON
+
+def starting_guess(eccentricity, mean_anomaly) ->np.ndarray:
+    """Gets a first approximation of the eccentric anomaly.
+    M + e*sin(M) is close enough for most orbits, Danby's starter
+    M + 0.85*e*sign(sin(M)) is used for very eccentric ones.
+
+    Args:
+        eccentricity (array_like): the orbital eccentricities
+        mean_anomaly (array_like): the mean anomalies in rad
+
+    Returns:
+        np.ndarray: the starting eccentric anomalies in rad
+    """
+    e = np.asarray(eccentricity, dtype=np.float64)
+    M = np.asarray(mean_anomaly, dtype=np.float64)
+    sin_M = np.sin(M)
+    return np.where(e < 0.8, M + e * sin_M, M + 0.85 * e * np.sign(sin_M))
+
+def newton_raphson(eccentricity, mean_anomaly, tolerance:float=TOLERANCE,
+                   max_iterations:int=MAX_ITERATIONS) ->tuple:
+    """Solves Kepler's equation M = E - e*sin(E) for whole arrays at once.
+    Iterations stop as soon as every value moved by less than the tolerance.
+    As |E - M| <= e, each root is kept in the bracket [M - e, M + e]:
+    a Newton step leaving it is pulled back on its bound, and replaced by
+    a bisection if it happens twice in a row (when e is close to 1).
+
+    Args:
+        eccentricity (array_like): the orbital eccentricities (0 <= e < 1)
+        mean_anomaly (array_like): the mean anomalies in rad
+        tolerance (float, optional): the convergence threshold in rad. Defaults to TOLERANCE.
+        max_iterations (int, optional): the maximum number of steps. Defaults to MAX_ITERATIONS.
+
+    Returns:
+        tuple: (eccentric anomalies in rad, nb of iterations used)
+    """
+    e, M = np.broadcast_arrays(np.asarray(eccentricity, dtype=np.float64),
+                               np.asarray(mean_anomaly, dtype=np.float64))
+    # work in [-pi, pi[ then restore the revolutions
+    revolutions = 2 * np.pi * np.floor((M + np.pi) / (2 * np.pi))
+    M = M - revolutions
+
+    low, high = M - e, M + e
+    E = np.clip(starting_guess(e, M), low, high)
+    escaped = np.zeros(E.shape, dtype=bool)
+    iterations = 0
+    for iterations in range(1, max_iterations + 1):
+        f_x = E - e * np.sin(E) - M
+        # f is increasing, its sign tells on which side of the root we are
+        low = np.where(f_x < 0, E, low)
+        high = np.where(f_x > 0, E, high)
+        step = E - f_x / (1 - e * np.cos(E))
+        outside = (step < low) | (step > high)
+        step = np.where(outside & escaped, (low + high) / 2, np.clip(step, low, high))
+        escaped = outside
+        delta = np.abs(step - E)
+        E = step
+        if not delta.size or delta.max() < tolerance:
+            break
+
+    return E + revolutions, iterations
+
+class LookupTable():
+    """This class precomputes the eccentric anomaly over a grid of
+    (mean anomaly, eccentricity) and answers Kepler queries by bilinear
+    interpolation followed by a single Newton-Raphson polish step.
+    As E(-M) = -E(M), only M in [0, pi] is stored. Eccentricities above
+    max_eccentricity are left to newton_raphson.
+
+        Args:
+            mean_anomaly_steps (int): nb of samples of M in [0, pi]
+            eccentricity_steps (int): nb of samples of e in [0, max_eccentricity]
+            max_eccentricity (float): the highest eccentricity covered by the table
+        """
+    def __init__(self, mean_anomaly_steps:int=1024, eccentricity_steps:int=256,
+                 max_eccentricity:float=0.95, table:np.ndarray=None) -> None:
+        self._max_eccentricity = max_eccentricity
+        if table is None:
+            M = np.linspace(0, np.pi, mean_anomaly_steps)
+            e = np.linspace(0, max_eccentricity, eccentricity_steps)
+            table = newton_raphson(e[np.newaxis, :], M[:, np.newaxis])[0]
+        self._table = table
+
+    def get_max_eccentricity(self) ->float:
+        return self._max_eccentricity
+
+    def save(self, path:str) ->None:
+        """Saves the table as a .npz file.
+
+        Args:
+            path (str): the file path
+        """
+        np.savez(path, table=self._table, max_eccentricity=self._max_eccentricity)
+
+    @classmethod
+    def load(cls, path:str) ->"LookupTable":
+        """Loads a table saved with LookupTable.save
+
+        Args:
+            path (str): the file path
+
+        Returns:
+            LookupTable: the table
+        """
+        with np.load(path) as data:
+            return cls(max_eccentricity=float(data["max_eccentricity"]), table=data["table"])
+
+    def interpolate(self, eccentricity, mean_anomaly) ->np.ndarray:
+        """Gets the tabulated eccentric anomaly, without polishing.
+        Eccentricities must be within the table range.
+
+        Args:
+            eccentricity (array_like): the orbital eccentricities
+            mean_anomaly (array_like): the mean anomalies in rad
+
+        Returns:
+            np.ndarray: the eccentric anomalies in rad
+        """
+        e, M = np.broadcast_arrays(np.asarray(eccentricity, dtype=np.float64),
+                                   np.asarray(mean_anomaly, dtype=np.float64))
+        revolutions = 2 * np.pi * np.floor((M + np.pi) / (2 * np.pi))
+        M = M - revolutions
+        sign = np.where(M < 0, -1.0, 1.0)
+
+        m_steps, e_steps = self._table.shape
+        m_idx = np.abs(M) / np.pi * (m_steps - 1)
+        e_idx = e / self._max_eccentricity * (e_steps - 1)
+        m0 = np.clip(np.floor(m_idx).astype(np.intp), 0, m_steps - 2)
+        e0 = np.clip(np.floor(e_idx).astype(np.intp), 0, e_steps - 2)
+        m_w = m_idx - m0
+        e_w = e_idx - e0
+
+        t = self._table
+        E = ((1 - m_w) * (1 - e_w) * t[m0, e0] + m_w * (1 - e_w) * t[m0 + 1, e0]
+             + (1 - m_w) * e_w * t[m0, e0 + 1] + m_w * e_w * t[m0 + 1, e0 + 1])
+        return sign * E + revolutions
+
+    def solve(self, eccentricity, mean_anomaly) ->np.ndarray:
+        """Solves Kepler's equation by interpolation and one Newton step.
+
+        Args:
+            eccentricity (array_like): the orbital eccentricities (0 <= e < 1)
+            mean_anomaly (array_like): the mean anomalies in rad
+
+        Returns:
+            np.ndarray: the eccentric anomalies in rad
+        """
+        e, M = np.broadcast_arrays(np.asarray(eccentricity, dtype=np.float64),
+                                   np.asarray(mean_anomaly, dtype=np.float64))
+        in_table = e <= self._max_eccentricity
+        E = self.interpolate(np.where(in_table, e, 0), M)
+        # at least 1D, to assign the eccentric anomalies out of the table
+        E = np.array(E - (E - e * np.sin(E) - M) / (1 - e * np.cos(E)), ndmin=1)
+
+        if not in_table.all():
+            out = np.atleast_1d(~in_table)
+            E[out] = newton_raphson(np.atleast_1d(e)[out], np.atleast_1d(M)[out])[0]
+        return E.reshape(e.shape)[()]
+
+_TABLE = None
+
+def get_table() ->LookupTable:
+    """Gets the lookup table of the process, built on first call.
+
+    Returns:
+        LookupTable: the table
+    """
+    global _TABLE
+    if _TABLE is None:
+        _TABLE = LookupTable()
+    return _TABLE
+
+def use_table(path:str=None) ->LookupTable:
+    """Switches the solver to the lookup table mode.
+    If a path is given, the table is loaded from it, or built and saved there.
+
+    Args:
+        path (str, optional): a .npz file to persist the table. Defaults to None.
+
+    Returns:
+        LookupTable: the table
+    """
+    global _TABLE, SOLVER
+    if path and os.path.isfile(path):
+        _TABLE = LookupTable.load(path)
+    table = get_table()
+    if path and not os.path.isfile(path):
+        table.save(path)
+    SOLVER = S_TABLE
+    return table
+
+def use_newton() ->None:
+    """Switches the solver back to the iterative mode.
+    """
+    global SOLVER
+    SOLVER = S_NEWTON
+
+def solve_eccentric_anomaly(eccentricity, mean_anomaly, tolerance:float=TOLERANCE) ->np.ndarray:
+    """Solves Kepler's equation M = E - e*sin(E) for whole arrays at once.
+    Inputs are broadcast against each other, so an (N,1) column of eccentricities
+    and a (N,K) grid of mean anomalies solves every object at every time sample.
+    Uses the lookup table if SOLVER is S_TABLE (see use_table), the tolerance is then ignored.
+
+    Args:
+        eccentricity (array_like): the orbital eccentricities (0 <= e < 1)
+        mean_anomaly (array_like): the mean anomalies in rad
+        tolerance (float, optional): the convergence threshold in rad. Defaults to TOLERANCE.
+
+    Returns:
+        np.ndarray: the eccentric anomalies in rad
+    """
+    if SOLVER == S_TABLE:
+        return get_table().solve(eccentricity, mean_anomaly)
+    return newton_raphson(eccentricity, mean_anomaly, tolerance)[0]
+
+def true_anomaly(eccentricity, eccentric_anomaly) ->np.ndarray:
+    """Converts eccentric anomalies to true anomalies.
+
+    Args:
+        eccentricity (array_like): the orbital eccentricities
+        eccentric_anomaly (array_like): the eccentric anomalies in rad
+
+    Returns:
+        np.ndarray: the true anomalies in rad, in [-pi, pi]
+    """
+    e = np.asarray(eccentricity, dtype=np.float64)
+    half = np.asarray(eccentric_anomaly, dtype=np.float64) / 2
+    return 2 * np.arctan2(np.sqrt(1 + e) * np.sin(half),
+                          np.sqrt(1 - e) * np.cos(half))
+
+def radius(semi_major_axis, eccentricity, theta) ->np.ndarray:
+    """Gets the distance to the focus from the true anomaly.
+
+    Args:
+        semi_major_axis (array_like): a, in any unit
+        eccentricity (array_like): the orbital eccentricities
+        theta (array_like): the true anomalies in rad
+
+    Returns:
+        np.ndarray: the radii, in the unit of a
+    """
+    e = np.asarray(eccentricity, dtype=np.float64)
+    return np.asarray(semi_major_axis, dtype=np.float64) * (1 - e**2) / (1 + e * np.cos(theta))
+
+def solve(eccentricity, mean_anomaly, semi_major_axis=1.0, tolerance:float=TOLERANCE) ->tuple:
+    """Solves Kepler's problem for a batch of objects and time samples.
+
+    Args:
+        eccentricity (array_like): the orbital eccentricities, e.g. shape (N,1)
+        mean_anomaly (array_like): the mean anomalies in rad, e.g. shape (N,K)
+        semi_major_axis (array_like, optional): a, e.g. shape (N,1). Defaults to 1.0.
+        tolerance (float, optional): the convergence threshold in rad. Defaults to TOLERANCE.
+
+    Returns:
+        tuple: (eccentric anomalies, true anomalies, radii), broadcast to a common shape
+    """
+    E = solve_eccentric_anomaly(eccentricity, mean_anomaly, tolerance)
+    theta = true_anomaly(eccentricity, E)
+    R = radius(semi_major_axis, eccentricity, theta)
+    return E, theta, R
+
+def rotation_matrices(inclination, ascending_node, arg_periapsis) ->np.ndarray:
+    """Gets the matrices rotating the orbital plane into the reference plane: Rz(node) Rx(i) Rz(w).
+
+    Args:
+        inclination (array_like): the orbital inclinations in rad
+        ascending_node (array_like): the longitudes of the ascending node in rad
+        arg_periapsis (array_like): the arguments of periapsis in rad
+
+    Returns:
+        np.ndarray: the matrices, shape (..., 3, 3)
+    """
+    i, node, w = np.broadcast_arrays(np.asarray(inclination, dtype=np.float64),
+                                     np.asarray(ascending_node, dtype=np.float64),
+                                     np.asarray(arg_periapsis, dtype=np.float64))
+    cos_i, sin_i = np.cos(i), np.sin(i)
+    cos_n, sin_n = np.cos(node), np.sin(node)
+    cos_w, sin_w = np.cos(w), np.sin(w)
+
+    matrices = np.empty(i.shape + (3, 3))
+    matrices[..., 0, 0] = cos_n * cos_w - sin_n * sin_w * cos_i
+    matrices[..., 0, 1] = -cos_n * sin_w - sin_n * cos_w * cos_i
+    matrices[..., 0, 2] = sin_n * sin_i
+    matrices[..., 1, 0] = sin_n * cos_w + cos_n * sin_w * cos_i
+    matrices[..., 1, 1] = -sin_n * sin_w + cos_n * cos_w * cos_i
+    matrices[..., 1, 2] = -cos_n * sin_i
+    matrices[..., 2, 0] = sin_w * sin_i
+    matrices[..., 2, 1] = cos_w * sin_i
+    matrices[..., 2, 2] = cos_i
+    return matrices
+
+def state_vectors(semi_major_axis, eccentricity, inclination, ascending_node,
+                  arg_periapsis, mean_anomaly, mean_motion) ->tuple:
+    """Gets the positions and velocities for a batch of objects and time samples,
+    relative to the focus of the orbits, the reference plane being the XY plane.
+
+    Args:
+        semi_major_axis (array_like): a, e.g. shape (N,1)
+        eccentricity (array_like): the orbital eccentricities, e.g. shape (N,1)
+        inclination (array_like): the orbital inclinations in rad, e.g. shape (N,1)
+        ascending_node (array_like): the longitudes of the ascending node in rad, e.g. shape (N,1)
+        arg_periapsis (array_like): the arguments of periapsis in rad, e.g. shape (N,1)
+        mean_anomaly (array_like): the mean anomalies in rad, e.g. shape (N,K)
+        mean_motion (array_like): 2*pi / period, e.g. shape (N,1)
+
+    Returns:
+        tuple: (positions, velocities), shape (..., 3), in the units of a and a / period unit
+    """
+    a = np.asarray(semi_major_axis, dtype=np.float64)
+    e = np.asarray(eccentricity, dtype=np.float64)
+    E = solve_eccentric_anomaly(e, mean_anomaly)
+    cos_E, sin_E = np.cos(E), np.sin(E)
+    b = a * np.sqrt(1 - e**2)
+    E_dot = np.asarray(mean_motion, dtype=np.float64) / (1 - e * cos_E)
+
+    # in the orbital plane, periapsis along X
+    plane_positions = np.stack(np.broadcast_arrays(a * (cos_E - e), b * sin_E, 0.0), axis=-1)
+    plane_velocities = np.stack(np.broadcast_arrays(-a * sin_E * E_dot, b * cos_E * E_dot, 0.0), axis=-1)
+
+    matrices = rotation_matrices(inclination, ascending_node, arg_periapsis)
+    positions = np.einsum("...ij,...j->...i", matrices, plane_positions)
+    velocities = np.einsum("...ij,...j->...i", matrices, plane_velocities)
+    return positions, velocities
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,166 @@
+import os, sqlite3
+from urllib.request import pathname2url
+from orbit import envs
+from orbit.database import COLUMNS, MMAP_SIZE, row_factory
+
+# the characteristics given by the user, the others are calculated from them
+ELEMENT_COLUMNS = COLUMNS[:12]
+
+class Projects():
+    """This class attaches the databases of several projects to a single SQLite connection,
+    so they can be compared or merged by queries running inside SQLite.
+    Older projects may miss some columns: only the columns of all the tables are used.
+
+        Args:
+            project_paths (list[str]): the project directories
+            read_only (bool, optional): Attaches the databases read-only and immutable. Defaults to True.
+        """
+    def __init__(self, project_paths:list, read_only:bool=True) -> None:
+        self._connection = sqlite3.connect("file::memory:", uri=True)
+        self._connection.row_factory = row_factory
+        self._cursor = self._connection.cursor()
+        self._cursor.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+
+        # by project name, the attached table
+        self._tables = {}
+        for i, project_path in enumerate(project_paths):
+            name = os.path.basename(os.path.normpath(project_path))
+            if name in self._tables:
+                raise RuntimeError(f"Two projects are named '{name}'.")
+            path = os.path.abspath(os.path.join(project_path, f"{name}_database.db"))
+            if not os.path.isfile(path):
+                raise RuntimeError(f"No database in '{project_path}'.")
+            uri = f"file:{pathname2url(path)}"
+            if read_only:
+                uri += "?mode=ro&immutable=1"
+            try:
+                self._cursor.execute("ATTACH DATABASE ? AS ?", (uri, f"p{i}"))
+            except sqlite3.OperationalError as error:
+                raise RuntimeError(f"Cannot attach '{project_path}': {error}")
+            self._tables[name] = f"p{i}.[{name}]"
+
+        self._columns = [column for column in COLUMNS
+                         if all(column in self._get_table_columns(i, name)
+                                for i, name in enumerate(self._tables))]
+
+    def _get_table_columns(self, i:int, name:str) ->list:
+        self._cursor.execute(f"PRAGMA p{i}.table_info([{name}])")
+        return [row[1] for row in self._cursor.fetchall()]
+
+    def _get_table(self, project:str) ->str:
+        if project not in self._tables:
+            raise RuntimeError(f"Unknown project '{project}'")
+        return self._tables[project]
+
+    def _check_columns(self, columns:list) ->list:
+        for column in columns:
+            if column not in self._columns:
+                raise RuntimeError(f"Unknown column '{column}'")
+        return columns
+
+    def get_projects(self) ->list:
+        return list(self._tables)
+
+    def get_columns(self) ->list:
+        """Gets the columns found in all the projects.
+        """
+        return self._columns
+
+    def _iter(self, sql:str, values:tuple=(), batch_size:int=1000):
+        cursor = self._connection.cursor()
+        try:
+            cursor.execute(sql, values)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            cursor.close()
+
+    def iter_union(self, columns:list=None, batch_size:int=1000):
+        """Reads the objects of all the projects, as one table.
+
+        Args:
+            columns (list, optional): the envs column names to read. Defaults to all the common ones.
+            batch_size (int, optional): nb of rows fetched at once. Defaults to 1000.
+
+        Yields:
+            tuple: the project name, then the values
+        """
+        projection = ",".join(f"[{column}]" for column in self._check_columns(columns or self._columns))
+        sql = " UNION ALL ".join(f"SELECT ?, {projection} FROM {table}" for table in self._tables.values())
+        yield from self._iter(sql, tuple(self._tables), batch_size)
+
+    def read_names(self) ->list:
+        """Gets the names found in any project, sorted and without duplicates.
+
+        Returns:
+            list[str]: the names
+        """
+        sql = " UNION ".join(f"SELECT [{envs.E_NAME}] FROM {table}" for table in self._tables.values())
+        self._cursor.execute(sql + " ORDER BY 1")
+        return [row[0] for row in self._cursor.fetchall()]
+
+    def iter_join(self, first:str, second:str, columns:list=None, batch_size:int=1000):
+        """Reads the objects found in two projects, side by side, sorted by name.
+
+        Args:
+            first (str): a project name
+            second (str): another project name
+            columns (list, optional): the envs column names to read, the name excluded.
+                Defaults to all the common ones.
+            batch_size (int, optional): nb of rows fetched at once. Defaults to 1000.
+
+        Yields:
+            tuple: the name, the values in the first project, then in the second one
+        """
+        columns = [column for column in self._check_columns(columns or self._columns) if column != envs.E_NAME]
+        projection = ",".join([f"a.[{column}]" for column in columns] + [f"b.[{column}]" for column in columns])
+        sql = f"""
+            SELECT a.[{envs.E_NAME}], {projection}
+            FROM {self._get_table(first)} AS a JOIN {self._get_table(second)} AS b
+            ON a.[{envs.E_NAME}] = b.[{envs.E_NAME}]
+            ORDER BY a.[{envs.E_NAME}]
+            """
+        yield from self._iter(sql, batch_size=batch_size)
+
+    def diff(self, first:str, second:str, columns:list=None) ->dict:
+        """Compares two projects by object name.
+
+        Args:
+            first (str): the project of reference
+            second (str): the project compared to it
+            columns (list, optional): the envs column names compared. Defaults to the
+                characteristics given by the user (the others are calculated from them).
+
+        Returns:
+            dict: sorted names, "added" (only in second), "removed" (only in first)
+                and "changed" (in both, with different values)
+        """
+        columns = columns or [column for column in ELEMENT_COLUMNS if column in self._columns]
+        columns = [column for column in self._check_columns(columns) if column != envs.E_NAME]
+        a, b = self._get_table(first), self._get_table(second)
+        name = f"[{envs.E_NAME}]"
+
+        self._cursor.execute(f"SELECT {name} FROM {b} EXCEPT SELECT {name} FROM {a} ORDER BY 1")
+        added = [row[0] for row in self._cursor.fetchall()]
+        self._cursor.execute(f"SELECT {name} FROM {a} EXCEPT SELECT {name} FROM {b} ORDER BY 1")
+        removed = [row[0] for row in self._cursor.fetchall()]
+
+        changed = []
+        if columns:
+            different = " OR ".join(f"a.[{column}] IS NOT b.[{column}]" for column in columns)
+            self._cursor.execute(f"""
+                SELECT a.{name} FROM {a} AS a JOIN {b} AS b ON a.{name} = b.{name}
+                WHERE {different} ORDER BY 1
+                """)
+            changed = [row[0] for row in self._cursor.fetchall()]
+
+        return {"added" : added, "removed" : removed, "changed" : changed}
+
+    def close(self) ->None:
+        self._connection.close()
+
+if __name__ == "__main__":
+    pass
@@ -3,6 +3,31 @@ import math
 from orbit.backend import ObjectInOrbit
 from orbit import envs
 
+# scene information storing the last change of the database applied to the scene
+SYNCED_INFO = "orbit_synced_change"
+
+def conform_name(name:str) ->str:
+    "Removes all invalid characters from name"
+    if "/" in name:
+        name = name.replace("/","_")
+    for i in range(0,9):
+        if name.startswith(str(i)):
+            name = name.replace(str(i),"")
+
+    return name
+
+def delete_rig(name:str) ->None:
+    """Deletes the 3D visualisation of an object from its name only
+
+    Args:
+        name (str): the name of the object
+    """
+    name = conform_name(name)
+    for node in [f"{name}_group", f"{name}_orbit_offset", f"{name}_control",
+                 f"{name}_follow", f"{name}_orbit"]:
+        if cmds.objExists(node):
+            cmds.delete(node)
+
 class File():
     def __init__(self) -> None:
         pass
@@ -14,9 +39,21 @@ class File():
         self.new_file()
         cmds.file(path, open=True)
 
+    def get_synced(self) ->int:
+        """Gets the sequence number of the last database change applied to the scene,
+        saved with it. 0 if unknown.
+        """
+        value = cmds.fileInfo(SYNCED_INFO, query=True)
+        return int(value[0]) if value else 0
+
+    def set_synced(self, seq:int) ->None:
+        cmds.fileInfo(SYNCED_INFO, str(seq))
+
 class Rig():
-    def __init__(self, obj:ObjectInOrbit, color:list=None) ->None:
+    def __init__(self, obj:ObjectInOrbit, color:list=None, keys:dict=None) ->None:
         self._obj = obj
+        # precomputed orbit keys, e.g. from the cache of the database
+        self._keys = keys
         self._name = self.conform_name()
         
         self._type = self._obj.get_type()
@@ -39,14 +76,7 @@ class Rig():
 
     def conform_name(self) ->str:
         "Removes all invalid characters from name"
-        name = self._obj.get_name()
-        if "/" in name:
-            name = name.replace("/","_")
-        for i in range(0,9):
-            if name.startswith(str(i)):
-                name = name.replace(str(i),"")
-
-        return name
+        return conform_name(self._obj.get_name())
 
     def get_inclination(self) ->float:
         """Converts the inclination of an orbit in maya units.
@@ -225,10 +255,12 @@ class Rig():
                 return i
             
     def anim_orbit(self, poc:str) ->None:
-        for t, v in self._obj.get_covered_distance_each_day().items():
+        # keys are placed for a linear interpolation
+        keys = self._keys if self._keys is not None else self._obj.get_adaptive_keys()
+        for t, v in keys.items():
             cmds.setKeyframe(f"{poc}.parameter", v=v, t=t)
 
-        cmds.keyTangent(f"{poc}.parameter", itt="spline", ott="spline")
+        cmds.keyTangent(f"{poc}.parameter", itt="linear", ott="linear")
         cmds.setInfinity(f"{poc}.parameter", pri="cycle", poi="cycle")
 
     def anim_offset(self) ->None:
@@ -1,7 +1,7 @@
 import os, sys, webbrowser
 from functools import partial
 from orbit.Qt import QtWidgets, QtGui, QtCore
-from orbit import envs
+from orbit import envs, epoch
 from orbit.presets import PRESETS
 from orbit.api import Api
 
@@ -30,7 +30,8 @@ HEADERS = [envs.E_NAME,
            envs.O_PERIHELION_D,
            envs.O_PERIHELION_V,
            envs.O_APHELION_D,
-           envs.O_APHELION_V]
+           envs.O_APHELION_V,
+           envs.O_PERIHELION_JD]
 
 class CustomTreeItem(QtWidgets.QTreeWidgetItem):
     def __init__(self, data:dict):
@@ -39,7 +40,7 @@ class CustomTreeItem(QtWidgets.QTreeWidgetItem):
             return
         self._data = data
         if data:
-            self._name = data[0]
+            self._name = data.name
             for i in range(len(HEADERS)):
                 self.setText(i, str(data[i]))
                 # self.setTextAlignment(i, QtCore.Qt.AlignCenter)
@@ -50,7 +51,7 @@ class CustomTreeItem(QtWidgets.QTreeWidgetItem):
                         self.setBackground(i, QtGui.QColor(50,50,50))
 
             # color type
-            self.setIcon(1, QtGui.QIcon(self.type_color(data[1])))
+            self.setIcon(1, QtGui.QIcon(self.type_color(data.type)))
 
         self.setSizeHint(2,QtCore.QSize(20,20))
 
@@ -238,17 +239,13 @@ class MainUI(QtWidgets.QMainWindow):
         self.reload_tree()
 
     def reload_parents(self) ->None:
-        parents = [envs.ORIGIN] + [p[0] for p in self._builder.read()]
+        parents = [envs.ORIGIN] + self._builder.read_names()
         self.glob_data[envs.E_PARENT].clear()
         self.glob_data[envs.E_PARENT].addItems(parents)
 
     def reload_tree(self) ->None:
         self.tree.clear()
-        objects = self._builder.read()
-        if not objects:
-            return
-  
-        for data in objects or []:
+        for data in self._builder.iter_elements():
             item = CustomTreeItem(data)
             self.tree.addTopLevelItem(item)
 
@@ -321,18 +318,18 @@ class MainUI(QtWidgets.QMainWindow):
         self.tab_widget.setCurrentIndex(self.tab_create_idx)
 
         # fill fields
-        self.glob_data[envs.E_NAME].setText(data[0])
-        self.glob_data[envs.E_TYPE].setItemText(0, data[1])
-        self.glob_data[envs.E_PARENT].setItemText(0, data[2])
-        self.obj_data[envs.E_MASS].setText(str(data[3]))
-        self.obj_data[envs.E_PERIOD].setText(str(data[4]))
-        self.obj_data[envs.E_INCLINATION].setText(str(data[5]))
-        self.orb_data[envs.O_SEMI_MAJOR_AXIS].setText(str(data[6]))
-        self.orb_data[envs.O_INCLINATION].setText(str(data[7]))
-        self.orb_data[envs.O_ECCENTRICITY].setText(str(data[8]))
-        self.orb_data[envs.O_ASCENDING_NODE].setText(str(data[9]))
-        self.orb_data[envs.O_ARG_PERIAPSIS].setText(str(data[10]))
-        date = eval(data[11])
+        self.glob_data[envs.E_NAME].setText(data.name)
+        self.glob_data[envs.E_TYPE].setItemText(0, data.type)
+        self.glob_data[envs.E_PARENT].setItemText(0, data.parent)
+        self.obj_data[envs.E_MASS].setText(str(data.mass))
+        self.obj_data[envs.E_PERIOD].setText(str(data.rotation_period))
+        self.obj_data[envs.E_INCLINATION].setText(str(data.axis_inclination))
+        self.orb_data[envs.O_SEMI_MAJOR_AXIS].setText(str(data.semi_major_axis))
+        self.orb_data[envs.O_INCLINATION].setText(str(data.inclination))
+        self.orb_data[envs.O_ECCENTRICITY].setText(str(data.eccentricity))
+        self.orb_data[envs.O_ASCENDING_NODE].setText(str(data.ascending_node))
+        self.orb_data[envs.O_ARG_PERIAPSIS].setText(str(data.arg_periapsis))
+        date = epoch.parse_date(data.perihelion_day)
         q_date = QtCore.QDate(int(date[0]),
                                 int(date[1]),
                                 int(date[2]))
@@ -453,6 +450,8 @@ class MainUI(QtWidgets.QMainWindow):
                     # only open existing scene
                     file = self.show_file_dialog(self._project_path)
                     self._builder.open_file(file)
+                    # refresh what changed since the scene was saved, then build the missing ones
+                    self._builder.sync()
                     self._builder.build_all(rebuild=False)
 
     def on_set_project_clicked(self) ->None:
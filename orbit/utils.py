@@ -1,14 +1,9 @@
 import json
-from datetime import datetime
-from orbit import envs
+from orbit import envs, epoch
 
 def days_from_j2000(year:int, month:int, day:int) ->int:
-    given_date = datetime(year, month, day)
     # J2000 (1er janvier 2000 à 12:00:00 UTC)
-    date_j2000 = datetime(2000, 1, 1, 12, 0, 0)
-    difference = given_date - date_j2000
-
-    return difference.days
+    return int(epoch.days_from_j2000(year, month, day))
 
 def convert_meters_to_au(meters:int) ->float:
     """Converts a distance in meters to astronomical unit